@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+
+# Asset build step: packs every PNG under assets/ into one texture atlas
+# image plus a small JSON index of where each sprite is, for
+# graphics.load_atlas. A file's name is its sprite name: player.png,
+# wall.png, floor.png, enemy.png for every enemy or enemy.orc.png for one
+# type, and so on. Atlases are cached under .atlas-cache/ keyed by a hash of
+# the source files, so they are only rebuilt when an asset changes.
+#
+#   python atlas.py            # build (or reuse) the atlas and print its paths
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import pygame
+from graphics import TILE_SIZE
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+ASSET_DIR = os.path.join(HERE, "assets")
+CACHE_DIR = os.path.join(HERE, ".atlas-cache")
+FORMAT = 1  # Bump when the atlas layout changes, so old caches are rebuilt
+
+def source_files(source):
+    # {sprite name: path}, in a stable order
+    names = sorted(name for name in os.listdir(source) if name.lower().endswith(".png"))
+    return {name[:-4]: os.path.join(source, name) for name in names}
+
+def source_hash(sources, size):
+    digest = hashlib.sha256(f"{FORMAT} {size}".encode())
+    for name, path in sources.items():
+        digest.update(name.encode() + b"\0")
+        with open(path, "rb") as f:
+            digest.update(hashlib.sha256(f.read()).digest())
+    return digest.hexdigest()[:16]
+
+def build_atlas(sources, size, image_path, index_path):
+    # Every sprite is scaled to the tile size here rather than at load time,
+    # then laid out on a square-ish grid
+    columns = max(1, math.ceil(math.sqrt(len(sources))))
+    rows = max(1, math.ceil(len(sources) / columns))
+    atlas = pygame.Surface((columns * size, rows * size), pygame.SRCALPHA)
+    sprites = {}
+    for number, (name, path) in enumerate(sources.items()):
+        image = pygame.image.load(path)
+        if image.get_size() != (size, size):
+            # smoothscale needs 32-bit pixels; PNGs may be paletted
+            rgba = pygame.Surface(image.get_size(), pygame.SRCALPHA)
+            rgba.blit(image, (0, 0))
+            image = pygame.transform.smoothscale(rgba, (size, size))
+        x = number % columns * size
+        y = number // columns * size
+        atlas.blit(image, (x, y), special_flags=pygame.BLEND_RGBA_MAX)  # A straight copy onto the clear atlas
+        sprites[name] = [x, y, size, size]
+
+    # Write under temporary names and rename, so a reader never sees half an atlas
+    pygame.image.save(atlas, image_path + ".tmp.png")
+    with open(index_path + ".tmp", "w") as f:
+        json.dump({"format": FORMAT, "tile_size": size, "sprites": sprites}, f)
+    os.replace(image_path + ".tmp.png", image_path)
+    os.replace(index_path + ".tmp", index_path)
+
+def ensure_atlas(source=ASSET_DIR, cache=CACHE_DIR, size=TILE_SIZE):
+    # Returns (image path, index path) of an up-to-date atlas, building it
+    # only on a cache miss; None if there are no assets
+    if not os.path.isdir(source):
+        return None
+    sources = source_files(source)
+    if not sources:
+        return None
+    key = source_hash(sources, size)
+    image_path = os.path.join(cache, f"atlas-{key}.png")
+    index_path = os.path.join(cache, f"atlas-{key}.json")
+    if os.path.exists(image_path) and os.path.exists(index_path):
+        return image_path, index_path
+
+    os.makedirs(cache, exist_ok=True)
+    for name in os.listdir(cache):
+        if name.startswith("atlas-"):
+            os.remove(os.path.join(cache, name))  # Stale atlases from older assets
+    build_atlas(sources, size, image_path, index_path)
+    return image_path, index_path
+
+def main():
+    parser = argparse.ArgumentParser(description="Pack the sprite assets into a cached texture atlas.")
+    parser.add_argument("--source", default=ASSET_DIR, help="directory of PNG sprites (default: assets/)")
+    parser.add_argument("--cache", default=CACHE_DIR, help="where built atlases are kept (default: .atlas-cache/)")
+    args = parser.parse_args()
+
+    paths = ensure_atlas(args.source, args.cache)
+    if paths is None:
+        print(f"no PNG assets in {args.source}")
+        return
+    print("\n".join(paths))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,307 @@
+#!/usr/bin/env python3
+
+# Benchmark suite: level generation, rendering, the message window, combat
+# and whole game turns. Runs headless on SDL's dummy video driver. Results
+# can be written as JSON and compared against an earlier run:
+#
+#   python bench.py --json baseline.json
+#   python bench.py --baseline baseline.json   # exits 1 on a regression
+#   python bench.py --filter render --quick
+
+import os
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")  # Must be set before pygame opens a display
+
+import argparse
+import json
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import pygame
+import graphics
+from atlas import ensure_atlas
+from game import GameState, ACTIONS
+from message_window import MessageWindow
+from monsters import Enemy
+from player import Player
+from renderer import Renderer
+from world import Dungeon, ENEMY_TYPES, GENERATORS
+
+SEED = 1234  # Every benchmark is seeded, so runs are comparable
+MIN_TIME = 0.2  # Seconds each sample runs for at least
+SIZES = [(25, 18), (200, 200), (1000, 1000)]
+QUICK_SIZES = SIZES[:2]
+LONG_HISTORY = 100000  # Messages logged before the message window benchmarks
+
+def blank_dungeon(width, height, generator):
+    # A Dungeon with nothing generated yet, so generation can be timed alone
+    dungeon = Dungeon.__new__(Dungeon)
+    dungeon.setup(width, height, None, False, generator)
+    dungeon.rng = random.Random(SEED)
+    return dungeon
+
+def sample(run):
+    # Calls run() (which returns operations done and seconds taken) until
+    # MIN_TIME has passed; returns operations per second
+    operations = 0
+    elapsed = 0.0
+    while elapsed < MIN_TIME:
+        done, seconds = run()
+        operations += done
+        elapsed += seconds
+    return operations / elapsed
+
+def bench_generate(width, height, generator):
+    def run():
+        dungeon = blank_dungeon(width, height, generator)
+        start = time.perf_counter()
+        dungeon.generate_dungeon()
+        return 1, time.perf_counter() - start
+    return run
+
+def bench_entities(width, height):
+    dungeon = blank_dungeon(width, height, "random")
+    dungeon.generate_dungeon()
+
+    def run():
+        dungeon.enemies, dungeon.treasures = [], []
+        dungeon.enemy_cells, dungeon.treasure_cells = {}, {}
+        start = time.perf_counter()
+        dungeon.generate_entities()
+        return 1, time.perf_counter() - start
+    return run
+
+def bench_render(width, height, dirty_rects, fov):
+    # A game walking about with monsters, drawn after every turn
+    screen = pygame.display.get_surface()
+    game = GameState((width, height), seed=SEED, moving_monsters=True)
+    renderer = Renderer(screen, dirty_rects=dirty_rects)
+    rng = random.Random(SEED)
+
+    def run():
+        frames = 0
+        elapsed = 0.0
+        for _ in range(20):
+            game.step("restart" if game.game_over else rng.choice(ACTIONS[:8]))
+            start = time.perf_counter()
+            renderer.draw(game.player, game.dungeon, game.message_window, game.game_over, game.field_of_view() if fov else None)
+            elapsed += time.perf_counter() - start
+            frames += 1
+        return frames, elapsed
+    return run
+
+def bench_map_layer(width, height):
+    # Drawing every tile under the camera with graphics.draw_tile
+    dungeon = Dungeon(width, height, seed=SEED)
+    layer = graphics.MapLayer(dungeon)
+    camera = graphics.Camera()
+
+    def run():
+        start = time.perf_counter()
+        layer.rebuild(camera)
+        return 1, time.perf_counter() - start
+    return run
+
+def long_message_window():
+    window = MessageWindow()
+    for number in range(LONG_HISTORY):
+        window.add_message(f"The goblin hits you for {number % 17}.")
+    return window
+
+def bench_add_message():
+    window = MessageWindow()
+
+    def run():
+        start = time.perf_counter()
+        for number in range(1000):
+            window.add_message(f"You hit the orc for {number % 13}.")
+        return 1000, time.perf_counter() - start
+    return run
+
+def bench_draw_messages(window, scroll):
+    # scroll lines up from the bottom; far enough up reads from the log file
+    screen = pygame.display.get_surface()
+    window.scroll_to_bottom()
+    window.scroll_up(scroll)
+
+    def run():
+        start = time.perf_counter()
+        for _ in range(50):
+            window.draw(screen)
+        return 50, time.perf_counter() - start
+    return run
+
+def bench_combat():
+    # Bump fights to the death against each enemy type, as GameState.step does them
+    def run():
+        fights = 0
+        start = time.perf_counter()
+        for _ in range(100):
+            for enemy_type in ENEMY_TYPES:
+                player = Player(1, 1)
+                player.attack += 20
+                enemy = Enemy(2, 1, enemy_type)
+                while enemy.health > 0 and player.health > 0:
+                    enemy.take_damage(player.attack)
+                    if enemy.health > 0:
+                        player.take_damage(enemy.attack)
+                fights += 1
+        return fights, time.perf_counter() - start
+    return run
+
+def bench_steps(width, height, moving_monsters):
+    game = GameState((width, height), seed=SEED, moving_monsters=moving_monsters)
+    rng = random.Random(SEED)
+
+    def run():
+        start = time.perf_counter()
+        for _ in range(1000):
+            game.step("restart" if game.game_over else rng.choice(ACTIONS[:8]))
+        return 1000, time.perf_counter() - start
+    return run
+
+def bench_explore(width, height):
+    # Auto-explore from a fresh level until it stops, fighting whatever
+    # blocks the way, as one keypress would
+    def run():
+        game = GameState((width, height), seed=SEED)
+        turns = 0
+        start = time.perf_counter()
+        for _ in range(20):
+            actions = game.explore()
+            if not actions:
+                break
+            turns += len(actions)
+        elapsed = time.perf_counter() - start
+        game.close()
+        return turns, elapsed
+    return run
+
+def bench_startup():
+    # Starts the game in a child process and reads its time to first frame,
+    # which includes importing everything and building the first level
+    directory = os.path.dirname(os.path.abspath(__file__))
+
+    def run():
+        child = subprocess.Popen([sys.executable, "main.py", "--startup-time", "--pregenerate", "0"],
+                                 cwd=directory, stdout=subprocess.PIPE, text=True)
+        line = child.stdout.readline()
+        while line and not line.startswith("First frame"):
+            line = child.stdout.readline()  # pygame's banner
+        child.terminate()
+        child.wait()
+        return 1, float(line.split()[3]) / 1000
+    return run
+
+def sprite_sources():
+    # A directory of PNGs like an assets/ folder, from the painted sprites;
+    # removed when the returned TemporaryDirectory is collected
+    source = tempfile.TemporaryDirectory(prefix="bench-assets-")
+    colors = {"player": graphics.PLAYER_COLOR, "enemy": graphics.ENEMY_COLOR, "treasure": graphics.TREASURE_COLOR}
+    for number in range(40):
+        for kind, paint in graphics.SPRITE_PAINTERS.items():
+            image = pygame.Surface((48, 48), pygame.SRCALPHA)
+            paint(image, image.get_rect(), colors[kind])
+            pygame.image.save(image, os.path.join(source.name, f"{kind}.v{number}.png"))
+    return source
+
+def bench_atlas(cached):
+    # Building the atlas from scratch, or loading an already built one. The
+    # temporary directories live as long as run() does.
+    source = sprite_sources()
+    cache = tempfile.TemporaryDirectory(prefix="bench-atlas-")
+
+    def run():
+        if not cached:
+            for name in os.listdir(cache.name):
+                os.remove(os.path.join(cache.name, name))
+        start = time.perf_counter()
+        graphics.load_atlas(*ensure_atlas(source.name, cache.name))
+        return 1, time.perf_counter() - start
+    return run
+
+def benchmarks(quick):
+    # (name, unit, factory); factories do their setup only when selected
+    sizes = QUICK_SIZES if quick else SIZES
+    cases = [("startup/first_frame", "starts/s", bench_startup)]
+    for width, height in sizes:
+        for generator in GENERATORS:
+            cases.append((f"generate/{generator}/{width}x{height}", "levels/s",
+                          lambda w=width, h=height, g=generator: bench_generate(w, h, g)))
+        cases.append((f"entities/{width}x{height}", "levels/s", lambda w=width, h=height: bench_entities(w, h)))
+    cases.append(("assets/atlas_build", "loads/s", lambda: bench_atlas(False)))
+    cases.append(("assets/atlas_cached", "loads/s", lambda: bench_atlas(True)))
+    cases.append(("render/map_layer", "frames/s", lambda: bench_map_layer(200, 200)))
+    for width, height in sizes:
+        cases.append((f"render/full/{width}x{height}", "frames/s", lambda w=width, h=height: bench_render(w, h, False, True)))
+        cases.append((f"render/dirty/{width}x{height}", "frames/s", lambda w=width, h=height: bench_render(w, h, True, True)))
+    cases.append(("render/dirty_no_fov/200x200", "frames/s", lambda: bench_render(200, 200, True, False)))
+    cases.append(("messages/add", "messages/s", bench_add_message))
+    windows = {}
+    history = lambda: windows.setdefault("long", long_message_window())
+    cases.append(("messages/draw_latest", "frames/s", lambda: bench_draw_messages(history(), 0)))
+    cases.append(("messages/draw_scrolled", "frames/s", lambda: bench_draw_messages(history(), LONG_HISTORY // 2)))
+    cases.append(("combat/duels", "fights/s", bench_combat))
+    cases.append(("game/steps", "turns/s", lambda: bench_steps(200, 200, False)))
+    cases.append(("game/steps_moving_monsters", "turns/s", lambda: bench_steps(200, 200, True)))
+    cases.append(("game/explore", "turns/s", lambda: bench_explore(200, 200)))
+    return cases
+
+def compare(value, baseline, tolerance):
+    # Higher is better for every unit here
+    change = value / baseline - 1
+    flag = "REGRESSION" if change < -tolerance else ""
+    return change, flag
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark suite for the dungeon game, run headless.")
+    parser.add_argument("--filter", default="", metavar="TEXT", help="only run benchmarks whose name contains TEXT")
+    parser.add_argument("--repeat", type=int, default=5, help="samples per benchmark; the median is reported")
+    parser.add_argument("--quick", action="store_true", help=f"skip the largest map size ({SIZES[-1][0]}x{SIZES[-1][1]})")
+    parser.add_argument("--json", metavar="FILE", help="write the results to FILE as JSON")
+    parser.add_argument("--baseline", metavar="FILE", help="compare against results from an earlier --json run")
+    parser.add_argument("--tolerance", type=float, default=0.10,
+                        help="slowdown against the baseline that counts as a regression (default: 0.10)")
+    args = parser.parse_args()
+
+    pygame.init()
+    pygame.display.set_mode((graphics.SCREEN_WIDTH, graphics.SCREEN_HEIGHT))
+    baseline = {}
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)["results"]
+
+    results = {}
+    regressions = 0
+    print(f"{'benchmark':<36} {'median':>12} {'unit':<12} {'vs baseline':>12}")
+    for name, unit, factory in benchmarks(args.quick):
+        if args.filter not in name:
+            continue
+        run = factory()
+        samples = [sample(run) for _ in range(args.repeat)]
+        value = statistics.median(samples)
+        results[name] = {"value": value, "unit": unit, "samples": samples}
+
+        versus = ""
+        if name in baseline:
+            change, flag = compare(value, baseline[name]["value"], args.tolerance)
+            versus = f"{change * 100:+.1f}% {flag}"
+            regressions += bool(flag)
+        print(f"{name:<36} {value:>12.1f} {unit:<12} {versus:>12}", flush=True)
+
+    if args.json:
+        meta = {"python": platform.python_version(), "pygame": pygame.version.ver,
+                "platform": platform.platform(), "repeat": args.repeat, "min_time": MIN_TIME}
+        with open(args.json, "w") as f:
+            json.dump({"meta": meta, "results": results}, f, indent=2)
+    pygame.quit()
+    if regressions:
+        print(f"{regressions} benchmark(s) slower than the baseline by more than {args.tolerance:.0%}")
+        return 1
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
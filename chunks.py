@@ -0,0 +1,167 @@
+#!/usr/bin/env python3
+
+import hashlib
+import struct
+import tempfile
+import zlib
+from collections import OrderedDict
+
+CHUNK_SIZE = 32  # Chunks are CHUNK_SIZE x CHUNK_SIZE tiles
+MAX_RESIDENT_CHUNKS = 25  # LRU window of chunks kept in memory
+COMPACT_MIN_BYTES = 1 << 20  # Superseded records tolerated before compacting, however few are live
+
+# Record header in the chunk store: chunk x, chunk y, tile bytes, extra bytes
+RECORD_HEADER = struct.Struct("<iiII")
+
+class ChunkStore:
+    # Append-only file of zlib-compressed chunk records. Only the offset, size
+    # and a digest of the newest record for each chunk are kept in memory. A
+    # chunk written back unchanged isn't stored again, and once superseded
+    # records take up more of the file than live ones it is compacted.
+    def __init__(self, path=None):
+        if path is None:
+            self.file = tempfile.TemporaryFile()
+        else:
+            self.file = open(path, "w+b")
+        self.offsets = {}
+        self.sizes = {}
+        self.digests = {}
+        self.end = 0  # Bytes in the file
+        self.live = 0  # Bytes in the newest record of each chunk
+
+    def __contains__(self, key):
+        return key in self.offsets
+
+    def write(self, key, tiles, extra=b""):
+        digest = hashlib.blake2b(tiles, digest_size=16)
+        digest.update(extra)
+        digest = digest.digest()
+        if self.digests.get(key) == digest:
+            return  # Same as the stored record
+        tiles = zlib.compress(bytes(tiles))
+        record = RECORD_HEADER.pack(key[0], key[1], len(tiles), len(extra)) + tiles + extra
+        self.file.seek(self.end)
+        self.file.write(record)
+        self.live += len(record) - self.sizes.get(key, 0)
+        self.offsets[key] = self.end
+        self.sizes[key] = len(record)
+        self.digests[key] = digest
+        self.end += len(record)
+        if self.end - self.live > max(self.live, COMPACT_MIN_BYTES):
+            self.compact()
+
+    def read(self, key):
+        self.file.flush()
+        self.file.seek(self.offsets[key])
+        _, _, tiles_length, extra_length = RECORD_HEADER.unpack(self.file.read(RECORD_HEADER.size))
+        tiles = bytearray(zlib.decompress(self.file.read(tiles_length)))
+        extra = self.file.read(extra_length)
+        return tiles, extra
+
+    def compact(self):
+        # Rewrite the file with only the newest record of each chunk
+        records = []
+        for key, offset in self.offsets.items():
+            self.file.seek(offset)
+            records.append((key, self.file.read(self.sizes[key])))
+        self.file.seek(0)
+        self.file.truncate()
+        self.end = 0
+        for key, record in records:
+            self.file.write(record)
+            self.offsets[key] = self.end
+            self.end += len(record)
+        self.live = self.end
+
+    def close(self):
+        self.file.close()
+
+class ChunkRow:
+    # One row of a ChunkedMap, so that chunked_map[y][x] reads and writes tiles
+    def __init__(self, chunked_map, y):
+        self.chunked_map = chunked_map
+        self.y = y
+
+    def __len__(self):
+        return self.chunked_map.width
+
+    def __getitem__(self, x):
+        return self.chunked_map.get(x, self.y)
+
+    def __setitem__(self, x, tile_type):
+        self.chunked_map.set(x, self.y, tile_type)
+
+class ChunkedMap:
+    # Tile map split into fixed-size chunks. Chunks are generated on first use,
+    # written to the store when they fall out of the LRU window and read back
+    # when they are needed again.
+    #
+    # generate(cx, cy) returns the chunk's tiles as a bytearray; on_load and
+    # on_evict let the owner attach extra data (entities) to each chunk.
+    def __init__(self, width, height, generate, on_load=None, on_evict=None,
+                 store=None, max_chunks=MAX_RESIDENT_CHUNKS):
+        self.width = width
+        self.height = height
+        self.generate = generate
+        self.on_load = on_load
+        self.on_evict = on_evict
+        self.store = store if store is not None else ChunkStore()
+        self.max_chunks = max_chunks
+        self.chunks = OrderedDict()
+        self.last_key = None
+        self.last_chunk = None
+
+    def __len__(self):
+        return self.height
+
+    def __getitem__(self, y):
+        return ChunkRow(self, y)
+
+    def chunk(self, cx, cy):
+        key = (cx, cy)
+        if key == self.last_key:
+            return self.last_chunk
+        tiles = self.chunks.get(key)
+        if tiles is None:
+            if key in self.store:
+                tiles, extra = self.store.read(key)
+                fresh = False
+            else:
+                tiles, extra = self.generate(cx, cy), b""
+                fresh = True
+            self.chunks[key] = tiles
+            if self.on_load:
+                self.on_load(cx, cy, extra, fresh)
+            while len(self.chunks) > self.max_chunks:
+                self.evict()
+        else:
+            self.chunks.move_to_end(key)
+        self.last_key = key
+        self.last_chunk = tiles
+        return tiles
+
+    def evict(self):
+        key, tiles = self.chunks.popitem(last=False)
+        extra = self.on_evict(*key) if self.on_evict else b""
+        self.store.write(key, tiles, extra)
+        if key == self.last_key:
+            self.last_key = None
+            self.last_chunk = None
+
+    def get(self, x, y):
+        return self.chunk(x // CHUNK_SIZE, y // CHUNK_SIZE)[(y % CHUNK_SIZE) * CHUNK_SIZE + x % CHUNK_SIZE]
+
+    def set(self, x, y, tile_type):
+        self.chunk(x // CHUNK_SIZE, y // CHUNK_SIZE)[(y % CHUNK_SIZE) * CHUNK_SIZE + x % CHUNK_SIZE] = tile_type
+
+    def load_around(self, x, y, radius):
+        cx0 = max(0, x - radius) // CHUNK_SIZE
+        cy0 = max(0, y - radius) // CHUNK_SIZE
+        cx1 = min(self.width - 1, x + radius) // CHUNK_SIZE
+        cy1 = min(self.height - 1, y + radius) // CHUNK_SIZE
+        for cy in range(cy0, cy1 + 1):
+            for cx in range(cx0, cx1 + 1):
+                self.chunk(cx, cy)
+
+    def close(self):
+        self.store.close()
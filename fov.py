@@ -0,0 +1,101 @@
+#!/usr/bin/env python3
+
+from chunks import CHUNK_SIZE
+
+FOV_RADIUS = 8  # How far the player can see, in tiles
+
+# (xx, xy, yx, yy) transforms that map the first octant onto each of the eight
+OCTANTS = ((1, 0, 0, 1), (0, 1, 1, 0), (0, -1, 1, 0), (-1, 0, 0, 1),
+           (-1, 0, 0, -1), (0, -1, -1, 0), (0, 1, -1, 0), (1, 0, 0, -1))
+
+class FieldOfView:
+    # The cells the player can see (recursive shadowcasting) and every cell
+    # they have seen on this level. Recomputed only when the player moved or a
+    # wall changed. Once a map layer draws it, cells whose visibility changed
+    # are collected in changed_cells for it, like Dungeon.changed_tiles.
+    def __init__(self, radius=FOV_RADIUS):
+        self.radius = radius
+        self.collect_changes = False  # Set by graphics.MapLayer; nothing drains the set without one
+        self.reset()
+
+    def reset(self):
+        # Forget everything, for a new level
+        self.visible = set()
+        self.explored = {}  # (chunk x, chunk y) -> bytearray of CHUNK_SIZE * CHUNK_SIZE flags
+        self.changed_cells = set()
+        self.key = None
+
+    def update(self, dungeon, x, y):
+        # Returns True if the field of view was recomputed
+        key = (id(dungeon), dungeon.tile_version, x, y)
+        if key == self.key:
+            return False
+        self.key = key
+
+        visible = {(x, y)}
+        for octant in OCTANTS:
+            self.cast(dungeon, x, y, 1, 1.0, 0.0, octant, visible)
+        for cell in visible - self.visible:
+            self.explore(*cell)
+        if self.collect_changes:
+            self.changed_cells |= visible ^ self.visible
+        self.visible = visible
+        return True
+
+    def cast(self, dungeon, ox, oy, row, start, end, octant, visible):
+        # Scan one octant row by row outwards, between the slopes start and
+        # end; every wall splits the scan and recurses for the part past it
+        if start < end:
+            return
+        xx, xy, yx, yy = octant
+        radius = self.radius
+        radius_squared = radius * radius
+        width = dungeon.width
+        height = dungeon.height
+        tiles = dungeon.map
+        new_start = start
+        for distance in range(row, radius + 1):
+            dx = -distance - 1
+            dy = -distance
+            blocked = False
+            while dx <= 0:
+                dx += 1
+                left_slope = (dx - 0.5) / (dy + 0.5)
+                right_slope = (dx + 0.5) / (dy - 0.5)
+                if start < right_slope:
+                    continue
+                if end > left_slope:
+                    break
+
+                mx = ox + dx * xx + dy * xy
+                my = oy + dx * yx + dy * yy
+                inside = 0 <= mx < width and 0 <= my < height
+                if inside and dx * dx + dy * dy <= radius_squared:
+                    visible.add((mx, my))
+                wall = not inside or tiles[my][mx] == 1
+
+                if blocked:
+                    if wall:
+                        new_start = right_slope
+                    else:
+                        blocked = False
+                        start = new_start
+                elif wall and distance < radius:
+                    blocked = True
+                    self.cast(dungeon, ox, oy, distance + 1, start, left_slope, octant, visible)
+                    new_start = right_slope
+            if blocked:
+                return
+
+    def explore(self, x, y):
+        chunk = self.explored.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        if chunk is None:
+            chunk = self.explored[(x // CHUNK_SIZE, y // CHUNK_SIZE)] = bytearray(CHUNK_SIZE * CHUNK_SIZE)
+        chunk[(y % CHUNK_SIZE) * CHUNK_SIZE + x % CHUNK_SIZE] = 1
+
+    def is_visible(self, x, y):
+        return (x, y) in self.visible
+
+    def is_explored(self, x, y):
+        chunk = self.explored.get((x // CHUNK_SIZE, y // CHUNK_SIZE))
+        return chunk is not None and chunk[(y % CHUNK_SIZE) * CHUNK_SIZE + x % CHUNK_SIZE] == 1
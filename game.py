@@ -0,0 +1,378 @@
+#!/usr/bin/env python3
+
+import hashlib
+import random
+import struct
+import graphics
+from player import Player
+from world import Dungeon
+from message_window import MessageWindow
+from levels import LevelPipeline
+from pathfinding import DistanceMap, UNREACHED, find_path
+from fov import FieldOfView
+from scheduler import Scheduler, action_time
+
+# Everything the player can do in a turn
+DIRECTIONS = {
+    "nw": (-1, -1),
+    "n": (0, -1),
+    "ne": (1, -1),
+    "e": (1, 0),
+    "se": (1, 1),
+    "s": (0, 1),
+    "sw": (-1, 1),
+    "w": (-1, 0),
+}
+ACTIONS = list(DIRECTIONS) + ["restart"]
+DIRECTION_NAMES = {delta: name for name, delta in DIRECTIONS.items()}
+
+SEED_MASK = 2**64 - 1
+
+MAX_AUTO_TURNS = 1000  # Most turns a single run, explore or travel command takes
+PATH_SEARCH_LIMIT = 250000  # Most cells a travel or explore path search visits
+
+# Player fields that make up the game state, for GameState.digest
+PLAYER_STATE = struct.Struct("<QiiiiiiiiiiiB")
+
+WELCOME = "Welcome to the dungeon! Use arrow keys to move. Press 'r' to restart."
+WELCOME_BACK = "Welcome back to the dungeon! Use arrow keys to move. Press 'r' to restart."
+CONTROLS = "Shift+direction runs, 'x' explores and clicking a tile you've seen travels there."
+
+class GameState:
+    # The game rules with no display attached: a Player, a Dungeon and the
+    # MessageWindow's messages, advanced one action at a time by step().
+    # Nothing here needs a window or the font subsystem.
+    # All randomness comes from the game's seed, so the same seed and the same
+    # actions always give the same game.
+    def __init__(self, map_size=(graphics.MAP_WIDTH, graphics.MAP_HEIGHT), chunked=False, generator="random",
+                 pregenerate=0, seed=None, moving_monsters=False):
+        self.setup(map_size, chunked, generator, seed, moving_monsters)
+        self.start_pipeline(pregenerate)
+        self.new_game(WELCOME)
+
+    def setup(self, map_size, chunked, generator, seed, moving_monsters=False):
+        self.map_size = map_size
+        self.chunked = chunked
+        self.generator = generator
+        self.moving_monsters = moving_monsters
+        # Distances to the player, shared by every monster that chases them
+        self.distance_map = DistanceMap()
+        self.fov = FieldOfView()
+        # Who acts when. Between steps the player is the one due to act, so
+        # it is out of the queue until its action is done.
+        self.scheduler = Scheduler()
+        # Any int is accepted, but recordings and saves store 64 unsigned bits
+        self.seed = (seed if seed is not None else random.getrandbits(63)) & SEED_MASK
+        self.rng = random.Random(self.seed)
+        # Each level's seed, in order, whether or not levels are built ahead
+        self.level_seeds = random.Random(self.rng.getrandbits(64))
+        self.levels = None
+        self.player = None
+        self.dungeon = None
+        self.message_window = None
+        self.turn = 0
+        self.game_over = False
+
+    def start_pipeline(self, pregenerate):
+        # Upcoming levels built in background processes, so restarting is instant
+        if pregenerate and not self.chunked:
+            self.levels = LevelPipeline(*self.map_size, generator=self.generator, seeds=self.level_seeds,
+                                        depth=pregenerate)
+
+    def new_game(self, welcome):
+        first = self.dungeon is None
+        self.close_level()
+        if self.levels:
+            dungeon = self.levels.first_level() if first else self.levels.next_level()
+        else:
+            dungeon = Dungeon(*self.map_size, chunked=self.chunked, generator=self.generator,
+                              seed=self.level_seeds.getrandbits(64))
+        message_window = MessageWindow()
+        message_window.add_message(welcome)
+        message_window.add_message(CONTROLS)
+        self.enter_level(Player(1, 1), dungeon, message_window)
+        self.game_over = False
+
+    def enter_level(self, player, dungeon, message_window):
+        # Used both for new games and for games loaded from a save
+        self.player = player
+        self.dungeon = dungeon
+        self.message_window = message_window
+        self.distance_map.reset()
+        self.fov.reset()
+        self.scheduler.reset()
+
+    def step(self, action):
+        # Returns True if the action did anything
+        if action == "restart":
+            self.new_game(WELCOME_BACK)
+            return True
+        if self.game_over:
+            return False
+
+        self.turn += 1
+        dx, dy = DIRECTIONS[action]
+        player = self.player
+        dungeon = self.dungeon
+        message_window = self.message_window
+
+        # Check if there's an enemy at the target position
+        enemy = dungeon.enemy_at(player.x + dx, player.y + dy)
+        moved = False
+        fought = None
+        if enemy:
+            # Combat: Player attacks enemy
+            actual_damage = enemy.take_damage(player.attack)
+            message_window.add_message(f"You hit the {enemy.type} for {actual_damage}.")
+
+            if enemy.health <= 0:
+                # Enemy defeated - player moves into square
+                message_window.add_message(f"You have slain the {enemy.type}!")
+                player.gain_exp(enemy.exp_reward)
+                dungeon.remove_enemy(enemy)
+                self.scheduler.unschedule(enemy)
+                moved = player.move(dx, dy, dungeon.map)
+            else:
+                # Enemy attacks back, which uses up its turn
+                fought = enemy
+                actual_damage = player.take_damage(enemy.attack)
+                message_window.add_message(f"The {enemy.type} hits you for {actual_damage}.")
+                if player.health <= 0:
+                    self.game_over = True
+        else:
+            # Normal movement (no enemy at target)
+            moved = player.move(dx, dy, dungeon.map)
+
+        if moved:
+            dungeon.load_around(player.x, player.y)
+            self.pick_up()
+        self.end_turn(fought)
+        return True
+
+    def end_turn(self, fought=None):
+        # Queue the player's next action, then run every monster that is due
+        # before it, until it is the player's turn again
+        scheduler = self.scheduler
+        player = self.player
+        scheduler.schedule(player, scheduler.now + action_time(player))
+        if self.moving_monsters and not self.game_over:
+            # Hitting back used up the enemy's next action. One that was asleep
+            # is queued here, a full action from now, so waking it below
+            # doesn't give it a second attack this turn.
+            if fought in scheduler:
+                scheduler.schedule(fought, scheduler.times[fought] + action_time(fought))
+            elif fought:
+                scheduler.schedule(fought, scheduler.now + action_time(fought))
+            self.wake_monsters()
+        while not self.game_over:
+            actor = scheduler.pop()
+            if actor is player:
+                break
+            self.monster_act(actor)
+
+    def wake_monsters(self):
+        # Monsters join the queue when the player comes near and leave it when
+        # they lose track of them, so only the nearby ones are ever scheduled.
+        # Newly woken ones act right away, closest first so they don't block
+        # each other.
+        player = self.player
+        scheduler = self.scheduler
+        distance_map = self.distance_map
+        distance_map.update(self.dungeon, player.x, player.y)
+
+        waking = []
+        for enemy in self.dungeon.enemies_within(player.x, player.y, distance_map.radius):
+            if enemy not in scheduler:
+                distance = distance_map.distance(enemy.x, enemy.y)
+                if distance != UNREACHED:
+                    waking.append((distance, enemy.y, enemy.x, enemy))
+        waking.sort(key=lambda entry: entry[:3])
+        for _, _, _, enemy in waking:
+            scheduler.schedule(enemy, scheduler.now)
+
+    def monster_act(self, enemy):
+        # Monsters step downhill on the shared distance map; adjacent ones attack
+        dungeon = self.dungeon
+        distance_map = self.distance_map
+        if dungeon.enemy_at(enemy.x, enemy.y) is not enemy:
+            return  # Gone since it was queued, e.g. its chunk was unloaded
+        distance = distance_map.distance(enemy.x, enemy.y)
+        if distance == UNREACHED:
+            return  # Lost the player; it sleeps until woken again
+
+        if distance == 1:
+            player = self.player
+            actual_damage = player.take_damage(enemy.attack)
+            self.message_window.add_message(f"The {enemy.type} hits you for {actual_damage}.")
+            if player.health <= 0:
+                self.game_over = True
+                return
+        else:
+            step = distance_map.step_toward(enemy.x, enemy.y, dungeon.enemy_cells)
+            if step:
+                dungeon.move_enemy(enemy, *step)
+        self.scheduler.schedule(enemy, self.scheduler.now + action_time(enemy))
+
+    def field_of_view(self):
+        # Brought up to date only when asked for, by the renderer or a command
+        # that needs to know what the player sees, so headless turns (replays,
+        # benchmarks) never pay for shadowcasting. Cached unless the player
+        # moved or a wall changed.
+        self.fov.update(self.dungeon, self.player.x, self.player.y)
+        return self.fov
+
+    def run(self, direction):
+        # Keep moving in one direction. Like explore() and travel(), this
+        # takes many turns in one call, with nothing drawn in between, and
+        # returns the actions taken so they can be recorded one by one.
+        return self.auto_move(lambda: direction)
+
+    def explore(self):
+        # Walk to the nearest explored floor next to unexplored ground, over
+        # and over, along breadth-first shortest paths
+        path = []
+
+        def next_action():
+            if not path or not self.is_frontier(*path[-1]):
+                found = self.find_path(self.is_frontier)
+                if found is None:
+                    self.message_window.add_message("There is nothing left to explore from here.")
+                    return None
+                path[:] = found
+            return self.action_toward(path.pop(0))
+        return self.auto_move(next_action)
+
+    def travel(self, x, y):
+        # Walk to an explored floor cell along the shortest known path
+        self.field_of_view()
+        path = self.find_path(lambda cx, cy: (cx, cy) == (x, y)) if self.is_known_floor(x, y) else None
+        if path is None:
+            self.message_window.add_message("You don't know a way there.")
+            return []
+        return self.auto_move(lambda: self.action_toward(path.pop(0)) if path else None)
+
+    def auto_move(self, next_action):
+        # Take turns until next_action() returns None or something needs the
+        # player's attention: an enemy or a new treasure in sight, a pickup,
+        # damage, or an enemy or wall in the way. Nothing is done while an
+        # enemy is already in sight.
+        player = self.player
+        dungeon = self.dungeon
+        enemies, seen_treasures = self.in_sight()
+        if enemies:
+            self.report_nearest(enemies)
+            return []
+        taken = []
+        while len(taken) < MAX_AUTO_TURNS and not self.game_over:
+            action = next_action()
+            if action is None:
+                break
+            dx, dy = DIRECTIONS[action]
+            x, y = player.x + dx, player.y + dy
+            if not self.is_floor(x, y) or dungeon.enemy_at(x, y):
+                break  # Never attack or walk into a wall by accident
+            treasure = dungeon.treasure_at(x, y)
+            health = player.health
+            self.step(action)
+            taken.append(action)
+            if treasure or player.health < health:
+                break
+
+            enemies, treasures = self.in_sight()
+            if enemies:
+                self.report_nearest(enemies)
+                break
+            if treasures - seen_treasures:
+                break
+        return taken
+
+    def report_nearest(self, enemies):
+        player = self.player
+        nearest = min(enemies, key=lambda enemy: (max(abs(enemy.x - player.x), abs(enemy.y - player.y)),
+                                                 enemy.y, enemy.x))
+        self.message_window.add_message(f"You see the {nearest.type}.")
+
+    def in_sight(self):
+        # The enemies and treasures the player can see
+        dungeon = self.dungeon
+        enemies = set()
+        treasures = set()
+        for x, y in self.field_of_view().visible:
+            enemy = dungeon.enemy_at(x, y)
+            if enemy:
+                enemies.add(enemy)
+            treasure = dungeon.treasure_at(x, y)
+            if treasure:
+                treasures.add(treasure)
+        return enemies, treasures
+
+    def is_floor(self, x, y):
+        dungeon = self.dungeon
+        return 0 <= x < dungeon.width and 0 <= y < dungeon.height and dungeon.map[y][x] != 1
+
+    def is_known_floor(self, x, y):
+        return self.fov.is_explored(x, y) and self.is_floor(x, y)
+
+    def is_frontier(self, x, y):
+        # Known floor with unexplored ground next to it
+        if not self.is_known_floor(x, y):
+            return False
+        dungeon = self.dungeon
+        for dx, dy in DIRECTIONS.values():
+            nx, ny = x + dx, y + dy
+            if 0 <= nx < dungeon.width and 0 <= ny < dungeon.height and not self.fov.is_explored(nx, ny):
+                return True
+        return False
+
+    def find_path(self, is_goal):
+        # Over known floor, around the enemies in the way
+        dungeon = self.dungeon
+        start = (self.player.x, self.player.y)
+        return find_path(start, lambda x, y: self.is_known_floor(x, y) and not dungeon.enemy_at(x, y),
+                         is_goal, PATH_SEARCH_LIMIT)
+
+    def action_toward(self, cell):
+        return DIRECTION_NAMES.get((cell[0] - self.player.x, cell[1] - self.player.y))
+
+    def pick_up(self):
+        # Check for a treasure where the player stepped
+        player = self.player
+        treasure = self.dungeon.treasure_at(player.x, player.y)
+        if not treasure:
+            return
+        if treasure.type == "gold":
+            player.gold += treasure.value
+            self.message_window.add_message(f"You've found {treasure.value} gold!")
+        elif treasure.type == "health":
+            healed = player.heal(treasure.value)
+            self.message_window.add_message(f"You've found a health potion and healed {healed} health!")
+        elif treasure.type == "sword":
+            player.attack += treasure.value
+            self.message_window.add_message(f"You've found a magic sword! Attack increased by {treasure.value}!")
+        self.dungeon.remove_treasure(treasure)
+
+    def digest(self):
+        # Fingerprint of the game state, for checking that a replay matches
+        player = self.player
+        dungeon = self.dungeon
+        state = hashlib.sha256(PLAYER_STATE.pack(
+            self.turn, player.x, player.y, player.health, player.max_health, player.attack, player.defense,
+            player.gold, player.level, player.exp, player.exp_to_level, len(dungeon.enemies), self.game_over))
+        state.update(dungeon.pack_entities(sorted(dungeon.enemies, key=lambda enemy: (enemy.y, enemy.x)),
+                                           sorted(dungeon.treasures, key=lambda treasure: (treasure.y, treasure.x))))
+        if not dungeon.chunked:
+            state.update(bytes(dungeon.get_tiles()))
+        return state.hexdigest()
+
+    def close_level(self):
+        if self.dungeon:
+            self.dungeon.close()
+            self.dungeon = None
+        if self.message_window:
+            self.message_window.close()
+            self.message_window = None
+
+    def close(self):
+        self.close_level()
+        if self.levels:
+            self.levels.close()
@@ -1,6 +1,8 @@
 #!/usr/bin/env python3
 
+import json
 import pygame
+from collections import OrderedDict
 
 # Constants
 SCREEN_WIDTH = 800
@@ -10,6 +12,8 @@ MAP_WIDTH = 25
 MAP_HEIGHT = 18
 MESSAGE_WINDOW_HEIGHT = 120  # Height of the message window
 GAME_AREA_HEIGHT = SCREEN_HEIGHT - MESSAGE_WINDOW_HEIGHT
+VIEW_WIDTH = SCREEN_WIDTH // TILE_SIZE  # Tiles visible on screen at once
+VIEW_HEIGHT = GAME_AREA_HEIGHT // TILE_SIZE
 
 # Colors
 BLACK = (0, 0, 0)
@@ -31,51 +35,241 @@ LIGHT_YELLOW = (255, 255, 200)
 MEDIUM_GRAY = (80, 80, 80)
 VERY_DARK_GRAY = (40, 40, 40)
 DARKER_YELLOW = (150, 150, 0)
+DIM_GRAY = (45, 45, 55)
+NEAR_BLACK = (20, 20, 25)
 
 PLAYER_COLOR = GREEN
 ENEMY_COLOR = RED
 TREASURE_COLOR = YELLOW
 WALL_COLOR = DARK_GRAY
 FLOOR_COLOR = DARKER_GRAY
+FOG_WALL_COLOR = DIM_GRAY  # Explored tiles the player can't currently see
+FOG_FLOOR_COLOR = NEAR_BLACK
 TEXT_COLOR = WHITE
 BACKGROUND_COLOR = BLACK
 
-def draw_tile(screen, x, y, tile_type):
+# Fonts are loaded straight from a file, once per size, and shared. None is
+# the font bundled with pygame; SysFont would find the same one, but only
+# after scanning every font installed on the system.
+FONT_PATH = None
+_fonts = {}
+
+def get_font(size):
+    font = _fonts.get(size)
+    if font is None:
+        font = pygame.font.Font(FONT_PATH, size)
+        _fonts[size] = font
+    return font
+
+# Least recently used cache of rendered text, keyed by (font size, text, color)
+TEXT_CACHE_SIZE = 256
+_text_cache = OrderedDict()
+
+def render_text(text, size, color):
+    key = (size, text, color)
+    surface = _text_cache.get(key)
+    if surface is not None:
+        _text_cache.move_to_end(key)
+        return surface
+    surface = get_font(size).render(text, True, color)
+    _text_cache[key] = surface
+    if len(_text_cache) > TEXT_CACHE_SIZE:
+        _text_cache.popitem(last=False)
+    return surface
+
+# Atlas sprite names for (is wall, fogged) tiles
+TILE_SPRITES = {(True, False): "wall", (True, True): "wall.fog", (False, False): "floor", (False, True): "floor.fog"}
+FOG_TINT = (115, 115, 140)  # Multiplied into tile sprites to fog them
+
+def draw_tile(screen, x, y, tile_type, fogged=False):
     rect = pygame.Rect(x * TILE_SIZE, y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-    if tile_type == 1:  # Wall
-        pygame.draw.rect(screen, WALL_COLOR, rect)
-        pygame.draw.rect(screen, MEDIUM_GRAY, rect, 1)
+    sprite = _sprite_cache.get((TILE_SPRITES[tile_type == 1, fogged], None, TILE_SIZE))
+    if sprite is not None:
+        screen.fill(BACKGROUND_COLOR, rect)  # Tile art may be see-through; don't let the old cell show
+        screen.blit(sprite, rect)
+    elif tile_type == 1:  # Wall
+        pygame.draw.rect(screen, FOG_WALL_COLOR if fogged else WALL_COLOR, rect)
+        pygame.draw.rect(screen, VERY_DARK_GRAY if fogged else MEDIUM_GRAY, rect, 1)
     else:  # Floor
-        pygame.draw.rect(screen, FLOOR_COLOR, rect)
-        pygame.draw.rect(screen, VERY_DARK_GRAY, rect, 1)
+        pygame.draw.rect(screen, FOG_FLOOR_COLOR if fogged else FLOOR_COLOR, rect)
+        pygame.draw.rect(screen, BLACK if fogged else VERY_DARK_GRAY, rect, 1)
+
+class Camera:
+    # The view rectangle, in tiles. Follows a target and stays inside the map.
+    def __init__(self, width=VIEW_WIDTH, height=VIEW_HEIGHT):
+        self.x = 0
+        self.y = 0
+        self.width = width
+        self.height = height
+
+    def follow(self, target, dungeon):
+        self.x = max(0, min(target.x - self.width // 2, dungeon.width - self.width))
+        self.y = max(0, min(target.y - self.height // 2, dungeon.height - self.height))
+
+    def contains(self, x, y):
+        return self.x <= x < self.x + self.width and self.y <= y < self.y + self.height
+
+    def to_screen(self, x, y):
+        return (x - self.x) * TILE_SIZE, (y - self.y) * TILE_SIZE
+
+def tile_position(x, y, camera=None):
+    if camera is None:
+        return x * TILE_SIZE, y * TILE_SIZE
+    return camera.to_screen(x, y)
+
+class MapLayer:
+    # Pre-rendered background of the tiles under the camera. When the camera
+    # moves the old pixels are scrolled and only the exposed rows and columns
+    # are drawn; otherwise only tiles the dungeon reports as changed are, and
+    # with a field of view the cells whose visibility changed.
+    def __init__(self, dungeon, fov=None, width=VIEW_WIDTH, height=VIEW_HEIGHT):
+        self.dungeon = dungeon
+        self.fov = fov
+        if fov:
+            fov.collect_changes = True
+        self.width = width
+        self.height = height
+        self.surface = pygame.Surface((width * TILE_SIZE, height * TILE_SIZE))
+        self.origin = None
+
+    def draw_cell(self, x, y):
+        sx = x - self.origin[0]
+        sy = y - self.origin[1]
+        fov = self.fov
+        if 0 <= x < self.dungeon.width and 0 <= y < self.dungeon.height and (fov is None or fov.is_explored(x, y)):
+            draw_tile(self.surface, sx, sy, self.dungeon.map[y][x], fogged=fov is not None and not fov.is_visible(x, y))
+        else:  # Off the map, or never seen
+            self.surface.fill(BACKGROUND_COLOR, (sx * TILE_SIZE, sy * TILE_SIZE, TILE_SIZE, TILE_SIZE))
+
+    def rebuild(self, camera):
+        self.origin = (camera.x, camera.y)
+        for y in range(camera.y, camera.y + self.height):
+            for x in range(camera.x, camera.x + self.width):
+                self.draw_cell(x, y)
+        self.dungeon.changed_tiles.clear()
+        if self.fov:
+            self.fov.changed_cells.clear()
+
+    def refresh(self, camera):
+        # Returns (scrolled, changed tiles inside the view)
+        if self.origin is None:
+            self.rebuild(camera)
+            return True, []
+        dx = camera.x - self.origin[0]
+        dy = camera.y - self.origin[1]
+        if abs(dx) >= self.width or abs(dy) >= self.height:
+            self.rebuild(camera)
+            return True, []
 
-def draw_player(screen, player):
-    rect = pygame.Rect(player.x * TILE_SIZE, player.y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-    pygame.draw.rect(screen, PLAYER_COLOR, rect)
-    pygame.draw.rect(screen, DARK_GREEN, rect, 2)
+        scrolled = dx != 0 or dy != 0
+        if scrolled:
+            self.surface.scroll(-dx * TILE_SIZE, -dy * TILE_SIZE)
+            self.origin = (camera.x, camera.y)
+            if dx > 0:
+                columns = range(self.width - dx, self.width)
+            else:
+                columns = range(0, -dx)
+            if dy > 0:
+                rows = range(self.height - dy, self.height)
+            else:
+                rows = range(0, -dy)
+            for sx in columns:
+                for sy in range(self.height):
+                    self.draw_cell(camera.x + sx, camera.y + sy)
+            for sy in rows:
+                for sx in range(self.width):
+                    self.draw_cell(camera.x + sx, camera.y + sy)
+
+        changed = self.dungeon.changed_tiles
+        if self.fov:
+            changed = changed | self.fov.changed_cells
+            self.fov.changed_cells.clear()
+        changed = [(x, y) for x, y in changed if camera.contains(x, y)]
+        for x, y in changed:
+            self.draw_cell(x, y)
+        self.dungeon.changed_tiles.clear()
+        return scrolled, changed
+
+def paint_player(surface, rect, color):
+    pygame.draw.rect(surface, color, rect)
+    pygame.draw.rect(surface, DARK_GREEN, rect, 2)
 
     # Draw a simple face
-    pygame.draw.circle(screen, BLACK, (rect.centerx - 5, rect.centery - 5), 3)
-    pygame.draw.circle(screen, BLACK, (rect.centerx + 5, rect.centery - 5), 3)
-    pygame.draw.arc(screen, BLACK, (rect.centerx - 8, rect.centery, 16, 10), 0, 3.14, 2)
+    pygame.draw.circle(surface, BLACK, (rect.centerx - 5, rect.centery - 5), 3)
+    pygame.draw.circle(surface, BLACK, (rect.centerx + 5, rect.centery - 5), 3)
+    pygame.draw.arc(surface, BLACK, (rect.centerx - 8, rect.centery, 16, 10), 0, 3.14, 2)
 
-def draw_enemy(screen, enemy):
-    rect = pygame.Rect(enemy.x * TILE_SIZE, enemy.y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-    pygame.draw.rect(screen, enemy.color, rect)
-    pygame.draw.rect(screen, DARKER_RED, rect, 2)
+def paint_enemy(surface, rect, color):
+    pygame.draw.rect(surface, color, rect)
+    pygame.draw.rect(surface, DARKER_RED, rect, 2)
 
     # Draw a simple face
-    pygame.draw.circle(screen, WHITE, (rect.centerx - 5, rect.centery - 5), 3)
-    pygame.draw.circle(screen, WHITE, (rect.centerx + 5, rect.centery - 5), 3)
-    pygame.draw.arc(screen, WHITE, (rect.centerx - 8, rect.centery, 16, 10), 0, 3.14, 2)
+    pygame.draw.circle(surface, WHITE, (rect.centerx - 5, rect.centery - 5), 3)
+    pygame.draw.circle(surface, WHITE, (rect.centerx + 5, rect.centery - 5), 3)
+    pygame.draw.arc(surface, WHITE, (rect.centerx - 8, rect.centery, 16, 10), 0, 3.14, 2)
 
-def draw_treasure(screen, treasure):
-    rect = pygame.Rect(treasure.x * TILE_SIZE, treasure.y * TILE_SIZE, TILE_SIZE, TILE_SIZE)
-    pygame.draw.rect(screen, treasure.color, rect)
-    pygame.draw.rect(screen, DARKER_YELLOW, rect, 2)
+def paint_treasure(surface, rect, color):
+    pygame.draw.rect(surface, color, rect)
+    pygame.draw.rect(surface, DARKER_YELLOW, rect, 2)
 
     # Draw a simple treasure symbol
-    pygame.draw.circle(screen, LIGHT_YELLOW, rect.center, 8)
+    pygame.draw.circle(surface, LIGHT_YELLOW, rect.center, 8)
+
+SPRITE_PAINTERS = {
+    "player": paint_player,
+    "enemy": paint_enemy,
+    "treasure": paint_treasure,
+}
+
+# Images keyed by (name, color, size). A color of None matches any color,
+# which is how the atlas's images are registered; names are a kind ("enemy") or a kind and variant ("enemy.orc").
+# Anything without an image is painted once and kept in _painted.
+_sprite_cache = {}
+_painted = {}
+
+def load_atlas(image_path, index_path):
+    # Loads a texture atlas built by atlas.py, converted to the display's
+    # pixel format once, and registers a sub-rect of it for every sprite, so
+    # blits need no conversion. Fogged tiles are tinted copies made here.
+    with open(index_path) as f:
+        index = json.load(f)
+    atlas = pygame.image.load(image_path).convert_alpha()
+    for name, rect in index["sprites"].items():
+        sprite = atlas.subsurface(rect)
+        _sprite_cache[(name, None, sprite.get_width())] = sprite
+        if name in ("wall", "floor"):
+            fogged = sprite.copy()
+            fogged.fill(FOG_TINT, special_flags=pygame.BLEND_RGB_MULT)
+            _sprite_cache[(name + ".fog", None, sprite.get_width())] = fogged
+    return atlas
+
+def get_sprite(kind, color, size=TILE_SIZE, variant=None):
+    sprite = _sprite_cache.get((kind, color, size))
+    if sprite is None and variant is not None:
+        sprite = _sprite_cache.get((f"{kind}.{variant}", None, size))
+    if sprite is None:
+        sprite = _sprite_cache.get((kind, None, size))
+    if sprite is None:
+        sprite = _painted.get((kind, color, size))
+    if sprite is None:
+        sprite = pygame.Surface((size, size))
+        SPRITE_PAINTERS[kind](sprite, sprite.get_rect(), color)
+        if pygame.display.get_surface() is not None:
+            sprite = sprite.convert()
+        _painted[(kind, color, size)] = sprite
+    return sprite
+
+def draw_player(screen, player, camera=None):
+    screen.blit(get_sprite("player", PLAYER_COLOR), tile_position(player.x, player.y, camera))
+
+def draw_enemy(screen, enemy, camera=None):
+    screen.blit(get_sprite("enemy", enemy.color, variant=enemy.type), tile_position(enemy.x, enemy.y, camera))
+
+def draw_treasure(screen, treasure, camera=None):
+    screen.blit(get_sprite("treasure", treasure.color, variant=treasure.type), tile_position(treasure.x, treasure.y, camera))
+
+# Area of the game surface covered by the HUD (health, gold, level, exp)
+HUD_RECT = pygame.Rect(0, 0, 220, 120)
 
 def draw_ui(screen, player, dungeon):
     # Draw health bar
@@ -83,13 +277,12 @@ def draw_ui(screen, player, dungeon):
     pygame.draw.rect(screen, GREEN, (10, 10, 200 * (player.health / player.max_health), 20))
     pygame.draw.rect(screen, WHITE, (10, 10, 200, 20), 2)
 
-    # Draw gold
-    font = pygame.font.SysFont(None, 24)
-    text = font.render(f"Gold: {player.gold}", True, TEXT_COLOR)
+    # Draw gold (labels are only re-rendered when their value changes)
+    text = render_text(f"Gold: {player.gold}", 24, TEXT_COLOR)
     screen.blit(text, (10, 40))
 
     # Draw level
-    text = font.render(f"Level: {player.level}", True, TEXT_COLOR)
+    text = render_text(f"Level: {player.level}", 24, TEXT_COLOR)
     screen.blit(text, (10, 70))
 
     # Draw exp
@@ -97,13 +290,30 @@ def draw_ui(screen, player, dungeon):
     pygame.draw.rect(screen, BLUE, (10, 100, 200 * (player.exp / player.exp_to_level), 10))
     pygame.draw.rect(screen, WHITE, (10, 100, 200, 10), 1)
 
+OVERLAY_WIDTH = 230
+OVERLAY_ROW_HEIGHT = 18
+OVERLAY_COLUMNS = (8, 100, 165)  # x of each column inside the panel
+
+def overlay_rect(rows):
+    height = rows * OVERLAY_ROW_HEIGHT + 8
+    return pygame.Rect(SCREEN_WIDTH - OVERLAY_WIDTH - 4, 4, OVERLAY_WIDTH, height)
+
+def draw_overlay(screen, rows):
+    # A translucent panel of text columns in the top right corner
+    rect = overlay_rect(len(rows))
+    panel = pygame.Surface(rect.size, pygame.SRCALPHA)
+    panel.fill((0, 0, 0, 180))
+    screen.blit(panel, rect)
+    for number, row in enumerate(rows):
+        for column, text in zip(OVERLAY_COLUMNS, row):
+            screen.blit(render_text(text, 18, TEXT_COLOR), (rect.x + column, rect.y + 4 + number * OVERLAY_ROW_HEIGHT))
+    return rect
+
 def draw_game_over(screen):
-    font = pygame.font.SysFont(None, 72)
-    text = font.render("GAME OVER", True, RED)
+    text = render_text("GAME OVER", 72, RED)
     text_rect = text.get_rect(center=(SCREEN_WIDTH//2, GAME_AREA_HEIGHT//2))
     screen.blit(text, text_rect)
 
-    font = pygame.font.SysFont(None, 36)
-    text = font.render("Press R to restart", True, WHITE)
+    text = render_text("Press R to restart", 36, WHITE)
     text_rect = text.get_rect(center=(SCREEN_WIDTH//2, GAME_AREA_HEIGHT//2 + 60))
     screen.blit(text, text_rect)
\ No newline at end of file
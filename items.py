@@ -3,17 +3,26 @@
 import random
 import graphics
 
+# Inclusive range each treasure type's value is drawn from. The order is also
+# the type code used in saved levels, so only append to it.
+VALUE_RANGES = {
+    "gold": (10, 50),
+    "health": (20, 50),
+    "sword": (5, 15),
+}
+
+TREASURE_COLORS = {
+    "gold": graphics.YELLOW,
+    "health": graphics.RED,
+    "sword": graphics.LIGHT_GRAY,
+}
+
 class Treasure:
-    def __init__(self, x, y, treasure_type):
+    __slots__ = ("x", "y", "type", "value", "color")
+
+    def __init__(self, x, y, treasure_type, rng=random):
         self.x = x
         self.y = y
         self.type = treasure_type
-        if treasure_type == "gold":
-            self.value = random.randint(10, 50)
-            self.color = graphics.YELLOW
-        elif treasure_type == "health":
-            self.value = random.randint(20, 50)
-            self.color = graphics.RED
-        elif treasure_type == "sword":
-            self.value = random.randint(5, 15)
-            self.color = graphics.LIGHT_GRAY
\ No newline at end of file
+        self.value = rng.randint(*VALUE_RANGES[treasure_type])
+        self.color = TREASURE_COLORS[treasure_type]
\ No newline at end of file
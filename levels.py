@@ -0,0 +1,53 @@
+#!/usr/bin/env python3
+
+import multiprocessing
+import random
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from world import Dungeon
+
+def build_level(width, height, generator, seed):
+    # Runs in a worker process; only the compact serialized level comes back
+    return Dungeon(width, height, generator=generator, seed=seed).to_bytes()
+
+class LevelPipeline:
+    # Generates the next `depth` levels ahead of time in a process pool. Every
+    # level's seed is drawn in order from one seed generator (a random.Random),
+    # so the sequence of levels is the same no matter which worker builds
+    # which level or when, and the same as building them one by one.
+    def __init__(self, width, height, generator="random", seeds=None, depth=2, workers=None):
+        self.width = width
+        self.height = height
+        self.generator = generator
+        self.seeds = seeds if seeds is not None else random.Random()
+        self.depth = depth
+        # Spawned rather than forked: the game creates the pool on a worker
+        # thread while SDL starts up, and forking a threaded process can
+        # deadlock the child
+        self.executor = ProcessPoolExecutor(max_workers=workers or depth, mp_context=multiprocessing.get_context("spawn"))
+        self.pending = deque()
+
+    def next_seed(self):
+        return self.seeds.getrandbits(64)
+
+    def fill(self):
+        while len(self.pending) < self.depth:
+            self.pending.append(self.executor.submit(build_level, self.width, self.height, self.generator, self.next_seed()))
+
+    def first_level(self):
+        # Built right here, since nothing can be ready yet; the workers start
+        # on the levels after it in the meantime
+        seed = self.next_seed()
+        self.fill()
+        return Dungeon(self.width, self.height, generator=self.generator, seed=seed)
+
+    def next_level(self):
+        # Only blocks if the level asked for hasn't finished generating yet
+        if not self.pending:
+            self.fill()
+        data = self.pending.popleft().result()
+        self.fill()
+        return Dungeon.from_bytes(data)
+
+    def close(self):
+        self.executor.shutdown(wait=False, cancel_futures=True)
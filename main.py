@@ -1,170 +1,212 @@
 #!/usr/bin/env python3
 
+import time
+STARTED = time.perf_counter()  # Before the other imports, so startup time includes them
+
+import argparse
+import os
 import pygame
 import sys
+from concurrent.futures import ThreadPoolExecutor
 import graphics
-from player import Player
-from world import Dungeon
-from message_window import MessageWindow
-
-# Initialize pygame
-pygame.init()
-
-# Create the screen
-screen = pygame.display.set_mode((graphics.SCREEN_WIDTH, graphics.SCREEN_HEIGHT))
-pygame.display.set_caption("Dungeon")
-clock = pygame.time.Clock()
+from atlas import ensure_atlas, ASSET_DIR
+from game import GameState, DIRECTIONS
+from world import GENERATORS
+from renderer import Renderer
+from replay import Recorder
+from profiler import Profiler
+from savegame import Autosaver, load_game, take_snapshot
+
+AUTOSAVE_TURNS = 25  # Autosave after this many turns, as well as on quit
+IDLE_TIMEOUT_MS = 500  # How long to sleep waiting for input before waking anyway (for animations)
+
+# Keys for each game action (numpad and arrow keys)
+KEY_ACTIONS = {
+    pygame.K_KP7: "nw",
+    pygame.K_KP8: "n",
+    pygame.K_UP: "n",
+    pygame.K_KP9: "ne",
+    pygame.K_KP6: "e",
+    pygame.K_RIGHT: "e",
+    pygame.K_KP3: "se",
+    pygame.K_KP2: "s",
+    pygame.K_DOWN: "s",
+    pygame.K_KP1: "sw",
+    pygame.K_KP4: "w",
+    pygame.K_LEFT: "w",
+    pygame.K_r: "restart",
+}
+EXPLORE_KEY = pygame.K_x  # Shift+direction runs; clicking a known tile travels there
+
+def map_size(text):
+    try:
+        width, height = (int(n) for n in text.lower().split("x"))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"expected WIDTHxHEIGHT, got {text!r}")
+    if width < 3 or height < 3:
+        raise argparse.ArgumentTypeError("the map must be at least 3x3")
+    return width, height
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="A rogue-like dungeon crawler in PyGame.")
+    parser.add_argument("--full-redraw", action="store_true",
+                        help="repaint and flip the whole screen every frame instead of only the changed rectangles")
+    parser.add_argument("--fixed-fps", action="store_true",
+                        help="poll for input and redraw 60 times a second instead of sleeping until something happens")
+    parser.add_argument("--map-size", type=map_size, default=(graphics.MAP_WIDTH, graphics.MAP_HEIGHT),
+                        metavar="WxH", help=f"dungeon size in tiles, e.g. 1000x1000 (default: {graphics.MAP_WIDTH}x{graphics.MAP_HEIGHT})")
+    parser.add_argument("--generator", choices=GENERATORS, default="random",
+                        help="level layout: scattered walls, BSP rooms and corridors, or cellular-automaton caves")
+    parser.add_argument("--pregenerate", type=int, default=2, metavar="N",
+                        help="levels to generate ahead in background processes so restarting is instant (0 to disable)")
+    parser.add_argument("--moving-monsters", action="store_true",
+                        help="monsters near the player chase and attack them")
+    parser.add_argument("--profile", nargs="?", const="", metavar="FILE",
+                        help="time each phase of every frame, show p50/p99 in an overlay and write the samples to FILE (.csv or .json) on exit")
+    parser.add_argument("--startup-time", action="store_true",
+                        help="print how long it took from starting to the first frame on screen")
+    parser.add_argument("--assets", default=ASSET_DIR, metavar="DIR",
+                        help="directory of PNG sprites, packed into a cached atlas at startup (default: assets/)")
+    parser.add_argument("--seed", type=int, default=None,
+                        help="seed for all of the game's randomness, to reproduce a run")
+    parser.add_argument("--record", metavar="FILE",
+                        help="record every action to FILE for replay.py")
+    parser.add_argument("--chunked", action="store_true",
+                        help="generate the map in chunks as the player explores, keeping only nearby chunks in memory")
+    parser.add_argument("--save", metavar="FILE",
+                        help="continue from FILE if it exists, and autosave to it while playing")
+    args = parser.parse_args()
+    if args.save and args.chunked:
+        parser.error("--save doesn't support --chunked dungeons yet")
+    if args.chunked and args.generator != "random":
+        parser.error("--chunked only supports the random generator")
+    if args.save and args.record and os.path.exists(args.save):
+        parser.error("--record needs a new game, but --save would continue an existing one")
+    return args
+
+def start_game(args):
+    # The game itself runs headless; the main loop only feeds it input and draws it
+    if args.save and os.path.exists(args.save):
+        return load_game(args.save, args.pregenerate)
+    return GameState(args.map_size, args.chunked, args.generator, args.pregenerate, args.seed,
+                     args.moving_monsters)
 
 def main():
-    # Create player
-    player = Player(1, 1)
-
-    # Create dungeon
-    dungeon = Dungeon(graphics.MAP_WIDTH, graphics.MAP_HEIGHT)
-
-    # Create message window
-    message_window = MessageWindow()
-    message_window.add_message("Welcome to the dungeon! Use arrow keys to move. Press 'r' to restart.")
-
-    # Game loop
+    args = parse_args()
+
+    # Build or load the first level on another thread while the window opens
+    with ThreadPoolExecutor(max_workers=1) as executor:
+        starting = executor.submit(start_game, args)
+
+        # Only the subsystems the game uses; pygame.init() would also start
+        # audio, joysticks and the rest
+        pygame.display.init()
+        pygame.font.init()
+
+        # Create the screen
+        screen = pygame.display.set_mode((graphics.SCREEN_WIDTH, graphics.SCREEN_HEIGHT))
+        pygame.display.set_caption("Dungeon")
+        atlas = ensure_atlas(args.assets)  # Without assets the sprites are painted
+        if atlas:
+            graphics.load_atlas(*atlas)
+        clock = pygame.time.Clock()
+        profiler = Profiler(enabled=args.profile is not None)
+        renderer = Renderer(screen, dirty_rects=not args.full_redraw, profiler=profiler)
+        game = starting.result()
+    recorder = Recorder(args.record, game) if args.record else None
+    autosaver = Autosaver(args.save) if args.save else None
+    saved_turn = game.turn
+
+    # Game loop. The game only changes when the player does something, so by
+    # default the loop sleeps in event.wait() and draws only after a change.
     running = True
-    game_over = False
+    redraw = True
 
     while running:
+        # Draw everything (only the changed regions unless --full-redraw)
+        # A profiled frame is everything done since the last one was drawn
+        if redraw or args.fixed_fps:
+            with profiler.phase("render"):
+                renderer.draw(game.player, game.dungeon, game.message_window, game.game_over, game.field_of_view())
+            profiler.end_frame()
+            redraw = False
+            if args.startup_time:
+                print(f"First frame after {(time.perf_counter() - STARTED) * 1000:.1f} ms", flush=True)
+                args.startup_time = False
+
+        if args.fixed_fps:
+            clock.tick(60)
+            events = pygame.event.get()
+        else:
+            events = [pygame.event.wait(IDLE_TIMEOUT_MS)] + pygame.event.get()
+
         # Handle events
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                running = False
-            elif event.type == pygame.KEYDOWN:
-                if not game_over:
-                    # Handle movement and combat
-                    dx, dy = 0, 0
-                    if event.key == pygame.K_KP7:  # Northwest
-                        dx, dy = -1, -1
-                    elif event.key == pygame.K_KP8 or event.key == pygame.K_UP:  # North
-                        dx, dy = 0, -1
-                    elif event.key == pygame.K_KP9:  # Northeast
-                        dx, dy = 1, -1
-                    elif event.key == pygame.K_KP6 or event.key == pygame.K_RIGHT:  # East
-                        dx, dy = 1, 0
-                    elif event.key == pygame.K_KP3:  # Southeast
-                        dx, dy = 1, 1
-                    elif event.key == pygame.K_KP2 or event.key == pygame.K_DOWN:  # South
-                        dx, dy = 0, 1
-                    elif event.key == pygame.K_KP1:  # Southwest
-                        dx, dy = -1, 1
-                    elif event.key == pygame.K_KP4 or event.key == pygame.K_LEFT:  # West
-                        dx, dy = -1, 0
-                    
-                    # Check if movement would trigger combat
-                    if dx != 0 or dy != 0:
-                        new_x = player.x + dx
-                        new_y = player.y + dy
-                        
-                        # Check if there's an enemy at the target position
-                        enemy_at_target = None
-                        for enemy in dungeon.enemies:
-                            if enemy.x == new_x and enemy.y == new_y:
-                                enemy_at_target = enemy
-                                break
-                        
-                        if enemy_at_target:
-                            # Combat: Player attacks enemy
-                            damage = player.attack
-                            actual_damage = enemy_at_target.take_damage(damage)
-                            message_window.add_message(f"You hit the {enemy_at_target.type} for {actual_damage}.")
-                            
-                            if enemy_at_target.health <= 0:
-                                # Enemy defeated - player moves into square
-                                message_window.add_message(f"You have slain the {enemy_at_target.type}!")
-                                player.gain_exp(enemy_at_target.exp_reward)
-                                dungeon.enemies.remove(enemy_at_target)
-                                player.move(dx, dy, dungeon.map)
-                            else:
-                                # Enemy attacks back
-                                damage = enemy_at_target.attack
-                                actual_damage = player.take_damage(damage)
-                                message_window.add_message(f"The {enemy_at_target.type} hits you for {actual_damage}.")
-                                if player.health <= 0:
-                                    game_over = True
+        with profiler.phase("events"):
+            for event in events:
+                if event.type == pygame.QUIT:
+                    running = False
+                elif event.type == pygame.KEYDOWN:
+                    action = KEY_ACTIONS.get(event.key)
+                    with profiler.phase("turn"):
+                        # Run and explore take many turns, drawn only once they stop
+                        if action in DIRECTIONS and event.mod & pygame.KMOD_SHIFT:
+                            actions = game.run(action)
+                            redraw = True
+                        elif event.key == EXPLORE_KEY:
+                            actions = game.explore()
+                            redraw = True
+                        elif action:
+                            actions = [action]
+                            if game.step(action):
+                                game.field_of_view()  # Explored even if more keys arrive before the next frame
+                                redraw = True
                         else:
-                            # Normal movement (no enemy at target)
-                            player.move(dx, dy, dungeon.map)
-
-                # Message window scrolling
-                if event.key == pygame.K_PAGEUP:
-                    message_window.scroll_up()
-                elif event.key == pygame.K_PAGEDOWN:
-                    message_window.scroll_down()
-                elif event.key == pygame.K_END:
-                    message_window.scroll_to_bottom()
-
-                if event.key == pygame.K_r:
-                    # Restart game
-                    player = Player(1, 1)
-                    dungeon = Dungeon(MAP_WIDTH, MAP_HEIGHT)
-                    message_window = MessageWindow()
-                    message_window.add_message("Welcome back to the dungeon! Use arrow keys to move. Press 'r' to restart.")
-                    game_over = False
-
-        if not game_over:
-            # Check for collisions with treasures
-            for treasure in dungeon.treasures[:]:
-                if treasure.x == player.x and treasure.y == player.y:
-                    if treasure.type == "gold":
-                        player.gold += treasure.value
-                        message_window.add_message(f"You've found {treasure.value} gold!")
-                    elif treasure.type == "health":
-                        healed = player.heal(treasure.value)
-                        message_window.add_message(f"You've found a health potion and healed {healed} health!")
-                    elif treasure.type == "sword":
-                        player.attack += treasure.value
-                        message_window.add_message(f"You've found a magic sword! Attack increased by {treasure.value}!")
-                    dungeon.treasures.remove(treasure)
-
-        # Draw everything
-        screen.fill(graphics.BACKGROUND_COLOR)
-
-        # Create a surface for the game area (clipped to avoid drawing over message window)
-        game_surface = pygame.Surface((graphics.SCREEN_WIDTH, graphics.GAME_AREA_HEIGHT))
-        game_surface.fill(graphics.BACKGROUND_COLOR)
-
-        # Draw dungeon
-        for y in range(dungeon.height):
-            for x in range(dungeon.width):
-                if y * graphics.TILE_SIZE < graphics.GAME_AREA_HEIGHT:  # Only draw if within game area
-                    graphics.draw_tile(game_surface, x, y, dungeon.map[y][x])
-
-        # Draw treasures
-        for treasure in dungeon.treasures:
-            if treasure.y * graphics.TILE_SIZE < graphics.GAME_AREA_HEIGHT:
-                graphics.draw_treasure(game_surface, treasure)
-
-        # Draw enemies
-        for enemy in dungeon.enemies:
-            if enemy.y * graphics.TILE_SIZE < graphics.GAME_AREA_HEIGHT:
-                graphics.draw_enemy(game_surface, enemy)
-
-        # Draw player
-        if player.y * graphics.TILE_SIZE < graphics.GAME_AREA_HEIGHT:
-            graphics.draw_player(game_surface, player)
-
-        # Draw UI
-        graphics.draw_ui(game_surface, player, dungeon)
-
-        # Blit the game surface to the main screen
-        screen.blit(game_surface, (0, 0))
-
-        # Draw message window
-        message_window.draw(screen)
-
-        # Draw game over message
-        if game_over:
-            graphics.draw_game_over(screen)
-
-        pygame.display.flip()
-        clock.tick(60)
-
+                            actions = []
+                    if recorder:
+                        for action in actions:
+                            recorder.record(action)
+
+                    # Message window scrolling
+                    if event.key in (pygame.K_PAGEUP, pygame.K_PAGEDOWN, pygame.K_END):
+                        redraw = True
+                    if event.key == pygame.K_PAGEUP:
+                        game.message_window.scroll_up()
+                    elif event.key == pygame.K_PAGEDOWN:
+                        game.message_window.scroll_down()
+                    elif event.key == pygame.K_END:
+                        game.message_window.scroll_to_bottom()
+                elif event.type == pygame.MOUSEBUTTONDOWN and event.button == 1:
+                    x, y = event.pos
+                    if y < graphics.GAME_AREA_HEIGHT:
+                        camera = renderer.camera
+                        with profiler.phase("turn"):
+                            actions = game.travel(camera.x + x // graphics.TILE_SIZE, camera.y + y // graphics.TILE_SIZE)
+                        redraw = True  # At least a message was added
+                        if recorder:
+                            for action in actions:
+                                recorder.record(action)
+                elif event.type in (pygame.WINDOWEXPOSED, pygame.VIDEOEXPOSE):
+                    # The window was uncovered or restored; its contents may be gone
+                    renderer.invalidate()
+                    redraw = True
+
+            # Snapshot on this thread (cheap), write on the autosave thread
+            if autosaver and game.turn - saved_turn >= AUTOSAVE_TURNS:
+                autosaver.submit(take_snapshot(game))
+                saved_turn = game.turn
+
+    if recorder:
+        recorder.close()
+    if autosaver:
+        autosaver.submit(take_snapshot(game))
+        autosaver.close()
+    # Last, so a bad path can't cost the recording or the save
+    if args.profile:
+        try:
+            profiler.dump(args.profile)
+        except OSError as error:
+            print(f"Couldn't write the profile to {args.profile}: {error}", file=sys.stderr)
+    game.close()
     pygame.quit()
     sys.exit()
 
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import os
+import struct
+import tempfile
+
+# Each line in the index file is the byte offset of that line in the data file
+OFFSET = struct.Struct("<Q")
+
+class MessageLog:
+    # Append-only message history on disk. Lines are found through a fixed-width
+    # offset index, so reading any page costs two seeks no matter how long the
+    # log is, and nothing but the line count is kept in memory.
+    def __init__(self, path=None):
+        if path is None:
+            self.data = tempfile.TemporaryFile()
+            self.index = tempfile.TemporaryFile()
+        else:
+            self.data = open(path, "a+b")
+            self.index = open(path + ".idx", "a+b")
+        self.count = self.index.seek(0, os.SEEK_END) // OFFSET.size
+        self.size = self.data.seek(0, os.SEEK_END)
+
+    def __len__(self):
+        return self.count
+
+    def append(self, text):
+        line = text.replace("\n", " ").encode("utf-8") + b"\n"
+        self.data.seek(0, os.SEEK_END)
+        self.data.write(line)
+        self.index.seek(0, os.SEEK_END)
+        self.index.write(OFFSET.pack(self.size))
+        self.size += len(line)
+        self.count += 1
+
+    def get_lines(self, start, end):
+        # Lines [start, end) as strings
+        start = max(0, start)
+        end = min(self.count, end)
+        if start >= end:
+            return []
+        self.index.flush()
+        self.data.flush()
+        self.index.seek(start * OFFSET.size)
+        offsets = [offset for (offset,) in OFFSET.iter_unpack(self.index.read((end - start) * OFFSET.size))]
+        self.data.seek(offsets[0])
+        if end < self.count:
+            self.index.seek(end * OFFSET.size)
+            stop = OFFSET.unpack(self.index.read(OFFSET.size))[0]
+        else:
+            stop = self.size
+        chunk = self.data.read(stop - offsets[0])
+        # Split on the newlines append() wrote only; str.splitlines() would
+        # also split on form feeds, \x1c-\x1e, \x85, \u2028 and others
+        return [line.decode("utf-8") for line in chunk.split(b"\n")[:-1]]
+
+    def close(self):
+        self.data.close()
+        self.index.close()
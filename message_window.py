@@ -1,51 +1,75 @@
 #!/usr/bin/env python3
 
 import pygame
+from collections import deque
 import graphics
+from message_log import MessageLog
 
 class MessageWindow:
-    def __init__(self):
-        self.messages = []
-        self.font = pygame.font.SysFont(None, 20)
-        self.max_messages = 50  # Keep last 50 messages
+    def __init__(self, log_path=None):
+        self.max_messages = 50  # Keep last 50 messages in memory
+        self.messages = deque(maxlen=self.max_messages)  # Ring buffer, oldest dropped on append
+        self.log = MessageLog(log_path)  # Full history for scrolling past the ring buffer
+        self.font_size = 20  # The font itself is loaded on first use, so headless games never need it
         self.scroll_offset = 0
+        self.version = 0  # Bumped whenever the visible contents may have changed
+
+    @property
+    def font(self):
+        return graphics.get_font(self.font_size)
 
     def add_message(self, text):
         self.messages.append(text)
-        if len(self.messages) > self.max_messages:
-            self.messages.pop(0)
+        self.log.append(text)
+        self.version += 1
         # Auto-scroll to bottom when new message arrives
         self.scroll_to_bottom()
 
-    def scroll_up(self):
-        max_scroll = max(0, len(self.messages) - self.get_visible_lines())
-        self.scroll_offset = min(self.scroll_offset + 1, max_scroll)
+    def scroll_up(self, lines=1):
+        max_scroll = max(0, len(self.log) - self.get_visible_lines())
+        self.scroll_offset = min(self.scroll_offset + lines, max_scroll)
+        self.version += 1
 
-    def scroll_down(self):
-        self.scroll_offset = max(0, self.scroll_offset - 1)
+    def scroll_down(self, lines=1):
+        self.scroll_offset = max(0, self.scroll_offset - lines)
+        self.version += 1
 
     def scroll_to_bottom(self):
         self.scroll_offset = 0
+        self.version += 1
 
     def get_visible_lines(self):
         return (graphics.MESSAGE_WINDOW_HEIGHT - 10) // self.font.get_height()
 
+    def get_lines(self, start, end):
+        # Serve from the ring buffer when possible, otherwise page in from disk
+        first_buffered = len(self.log) - len(self.messages)
+        if start >= first_buffered:
+            return [self.messages[i - first_buffered] for i in range(start, end)]
+        return self.log.get_lines(start, end)
+
+    def get_rect(self):
+        return pygame.Rect(0, graphics.GAME_AREA_HEIGHT, graphics.SCREEN_WIDTH, graphics.MESSAGE_WINDOW_HEIGHT)
+
+    def close(self):
+        self.log.close()
+
     def draw(self, screen):
         # Draw message window background
-        window_rect = pygame.Rect(0, graphics.GAME_AREA_HEIGHT, graphics.SCREEN_WIDTH, graphics.MESSAGE_WINDOW_HEIGHT)
+        window_rect = self.get_rect()
         pygame.draw.rect(screen, graphics.BLACK, window_rect)
         pygame.draw.rect(screen, graphics.WHITE, window_rect, 2)
 
-        if not self.messages:
+        if len(self.log) == 0:
             return
 
+        total = len(self.log)
         visible_lines = self.get_visible_lines()
-        start_index = max(0, len(self.messages) - visible_lines - self.scroll_offset)
-        end_index = len(self.messages) - self.scroll_offset
+        start_index = max(0, total - visible_lines - self.scroll_offset)
+        end_index = total - self.scroll_offset
 
         y_offset = graphics.GAME_AREA_HEIGHT + 5
-        for i in range(start_index, end_index):
-            if i >= 0 and i < len(self.messages):
-                text_surface = self.font.render(self.messages[i], True, graphics.LIGHT_GRAY)
-                screen.blit(text_surface, (5, y_offset))
-                y_offset += self.font.get_height()
\ No newline at end of file
+        for line in self.get_lines(start_index, end_index):
+            text_surface = graphics.render_text(line, self.font_size, graphics.LIGHT_GRAY)
+            screen.blit(text_surface, (5, y_offset))
+            y_offset += self.font.get_height()
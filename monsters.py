@@ -2,29 +2,24 @@
 
 import graphics
 
+# Every enemy type: health, attack, defense, experience reward, speed (the
+# player's is 100), color. The order is also the type code used in saved
+# levels, so only append to it.
+ENEMY_STATS = {
+    "goblin": (30, 8, 2, 25, 120, graphics.LIGHT_RED),
+    "orc": (60, 15, 5, 50, 100, graphics.DARK_RED),
+    "dragon": (120, 25, 10, 100, 80, graphics.PURPLE),
+}
+
 class Enemy:
+    # Slots instead of a __dict__, so a level can hold tens of thousands
+    __slots__ = ("x", "y", "type", "health", "attack", "defense", "exp_reward", "speed", "color")
+
     def __init__(self, x, y, enemy_type):
         self.x = x
         self.y = y
         self.type = enemy_type
-        if enemy_type == "goblin":
-            self.health = 30
-            self.attack = 8
-            self.defense = 2
-            self.exp_reward = 25
-            self.color = graphics.LIGHT_RED
-        elif enemy_type == "orc":
-            self.health = 60
-            self.attack = 15
-            self.defense = 5
-            self.exp_reward = 50
-            self.color = graphics.DARK_RED
-        elif enemy_type == "dragon":
-            self.health = 120
-            self.attack = 25
-            self.defense = 10
-            self.exp_reward = 100
-            self.color = graphics.PURPLE
+        self.health, self.attack, self.defense, self.exp_reward, self.speed, self.color = ENEMY_STATS[enemy_type]
 
     def take_damage(self, damage):
         actual_damage = max(1, damage - self.defense)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+
+from array import array
+from collections import deque
+
+MONSTER_RADIUS = 12  # Monsters further than this from the player don't chase
+UNREACHED = 0xFFFF
+
+# Steps in the order they are tried, so ties always break the same way
+NEIGHBORS = ((0, -1), (1, 0), (0, 1), (-1, 0), (-1, -1), (1, -1), (1, 1), (-1, 1))
+
+class DistanceMap:
+    # Breadth-first distances (8-way, like the player's moves) from a source
+    # to every floor tile in a square window around it. Built once per turn
+    # and shared by every monster, which then just walks downhill: the cost is
+    # one search per turn, not one per monster.
+    def __init__(self, radius=MONSTER_RADIUS):
+        self.radius = radius
+        self.size = 2 * radius + 1
+        self.distances = array("H", [UNREACHED]) * (self.size * self.size)
+        self.origin = (0, 0)
+        self.key = None
+
+    def reset(self):
+        # Forget the cached search, e.g. when a new level replaces the old one
+        self.key = None
+
+    def update(self, dungeon, x, y):
+        # Recompute only when the source moved or the map changed
+        key = (id(dungeon), dungeon.tile_version, x, y)
+        if key == self.key:
+            return
+        self.key = key
+
+        size = self.size
+        ox = x - self.radius
+        oy = y - self.radius
+        self.origin = (ox, oy)
+
+        # Copy the window's walls once; anything off the map counts as wall
+        walls = bytearray(b"\x01") * (size * size)
+        for wy in range(size):
+            ty = oy + wy
+            if 0 <= ty < dungeon.height:
+                row = dungeon.map[ty]
+                for wx in range(max(0, -ox), min(size, dungeon.width - ox)):
+                    walls[wy * size + wx] = row[ox + wx]
+
+        distances = self.distances
+        distances[:] = array("H", [UNREACHED]) * (size * size)
+        start = self.radius * size + self.radius
+        distances[start] = 0
+        queue = deque([start])
+        while queue:
+            i = queue.popleft()
+            wx, wy = i % size, i // size
+            step = distances[i] + 1
+            for dx, dy in NEIGHBORS:
+                nx, ny = wx + dx, wy + dy
+                if 0 <= nx < size and 0 <= ny < size:
+                    j = ny * size + nx
+                    if distances[j] == UNREACHED and not walls[j]:
+                        distances[j] = step
+                        queue.append(j)
+
+    def distance(self, x, y):
+        wx = x - self.origin[0]
+        wy = y - self.origin[1]
+        if 0 <= wx < self.size and 0 <= wy < self.size:
+            return self.distances[wy * self.size + wx]
+        return UNREACHED
+
+    def step_toward(self, x, y, occupied=()):
+        # The neighbouring cell that is closest to the source, skipping
+        # occupied cells; None if there is no way to get closer
+        best = None
+        best_distance = self.distance(x, y)
+        for dx, dy in NEIGHBORS:
+            nx, ny = x + dx, y + dy
+            distance = self.distance(nx, ny)
+            if distance < best_distance and (nx, ny) not in occupied:
+                best = (nx, ny)
+                best_distance = distance
+        return best
+
+def find_path(start, passable, is_goal, limit=None):
+    # Breadth-first search from start (8-way) through cells where
+    # passable(x, y), to the nearest cell where is_goal(x, y). Returns the
+    # cells to step through, start excluded, or None if no goal is reachable
+    # within limit visited cells.
+    parents = {start: None}
+    queue = deque([start])
+    while queue:
+        cell = queue.popleft()
+        if is_goal(*cell):
+            path = []
+            while cell != start:
+                path.append(cell)
+                cell = parents[cell]
+            path.reverse()
+            return path
+        if limit is not None and len(parents) >= limit:
+            return None
+        x, y = cell
+        for dx, dy in NEIGHBORS:
+            neighbor = (x + dx, y + dy)
+            if neighbor not in parents and passable(*neighbor):
+                parents[neighbor] = cell
+                queue.append(neighbor)
+    return None
@@ -1,7 +1,5 @@
 #!/usr/bin/env python3
 
-import graphics
-
 class Player:
     def __init__(self, x, y):
         self.x = x
@@ -14,13 +12,14 @@ class Player:
         self.level = 1
         self.exp = 0
         self.exp_to_level = 100
+        self.speed = 100  # See scheduler.action_time
 
     def move(self, dx, dy, dungeon):
         new_x = self.x + dx
         new_y = self.y + dy
 
         # Check if the move is valid
-        if 0 <= new_x < graphics.MAP_WIDTH and 0 <= new_y < graphics.MAP_HEIGHT:
+        if 0 <= new_y < len(dungeon) and 0 <= new_x < len(dungeon[0]):
             if dungeon[new_y][new_x] != 1:  # 1 represents walls
                 self.x = new_x
                 self.y = new_y
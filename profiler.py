@@ -0,0 +1,106 @@
+#!/usr/bin/env python3
+
+import csv
+import json
+import time
+from collections import deque
+from contextlib import nullcontext
+
+# What a frame's time is split into. Phases nest, and each one only counts
+# the time not spent in a phase inside it, so a frame's phases add up to the
+# whole frame.
+PHASES = ["events", "turn", "render", "map", "entities", "ui", "messages", "present"]
+HISTORY = 3600  # Frames kept, a minute at 60 FPS
+SUMMARY_FRAMES = 30  # Recompute the percentiles shown in the overlay this often
+
+def percentile(ordered, fraction):
+    # Nearest-rank percentile of an already sorted list
+    if not ordered:
+        return 0.0
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+class Phase:
+    __slots__ = ("profiler", "index")
+
+    def __init__(self, profiler, index):
+        self.profiler = profiler
+        self.index = index
+
+    def __enter__(self):
+        self.profiler.push(self.index)
+
+    def __exit__(self, *exc_info):
+        self.profiler.pop()
+
+class Profiler:
+    # Times each phase of every frame into a ring buffer of the last HISTORY
+    # frames. A disabled profiler hands out no-op context managers, so the
+    # instrumented code costs next to nothing when profiling is off.
+    def __init__(self, enabled=True, history=HISTORY):
+        self.enabled = enabled
+        self.frames = deque(maxlen=history)  # One tuple of seconds per phase
+        self.phases = {name: Phase(self, index) for index, name in enumerate(PHASES)}
+        self.disabled = nullcontext()
+        self.current = [0.0] * len(PHASES)
+        self.stack = []
+        self.started = 0.0
+        self.summary = []
+        self.summarized = 0
+
+    def phase(self, name):
+        if not self.enabled:
+            return self.disabled
+        return self.phases[name]
+
+    def push(self, index):
+        now = time.perf_counter()
+        if self.stack:
+            self.current[self.stack[-1]] += now - self.started
+        self.stack.append(index)
+        self.started = now
+
+    def pop(self):
+        now = time.perf_counter()
+        self.current[self.stack.pop()] += now - self.started
+        self.started = now
+
+    def end_frame(self):
+        if not self.enabled:
+            return
+        self.frames.append(tuple(self.current))
+        self.current = [0.0] * len(PHASES)
+        self.summarized += 1
+
+    def percentiles(self):
+        # {phase: (p50, p99)} in milliseconds, plus the whole frame as "total"
+        columns = list(zip(*self.frames)) or [()] * len(PHASES)
+        columns.append([sum(frame) for frame in self.frames])
+        result = {}
+        for name, column in zip(PHASES + ["total"], columns):
+            ordered = sorted(column)
+            result[name] = (percentile(ordered, 0.5) * 1000, percentile(ordered, 0.99) * 1000)
+        return result
+
+    def overlay_rows(self):
+        # Rows for graphics.draw_overlay; sorting the history is too slow to
+        # do every frame, so the numbers are refreshed every SUMMARY_FRAMES
+        if not self.summary or self.summarized >= SUMMARY_FRAMES:
+            self.summarized = 0
+            self.summary = [("phase", "p50 ms", "p99 ms")]
+            for name, (p50, p99) in self.percentiles().items():
+                self.summary.append((name, f"{p50:.2f}", f"{p99:.2f}"))
+        return self.summary
+
+    def dump(self, path):
+        # JSON if the path ends in .json, CSV otherwise; times in milliseconds
+        rows = [[round(seconds * 1000, 4) for seconds in frame] for frame in self.frames]
+        if path.endswith(".json"):
+            summary = {name: {"p50": p50, "p99": p99} for name, (p50, p99) in self.percentiles().items()}
+            with open(path, "w") as f:
+                json.dump({"phases": PHASES, "summary": summary, "frames": rows}, f)
+        else:
+            with open(path, "w", newline="") as f:
+                writer = csv.writer(f)
+                writer.writerow(["frame"] + PHASES)
+                for number, row in enumerate(rows):
+                    writer.writerow([number] + row)
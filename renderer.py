@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+
+import pygame
+import graphics
+from profiler import Profiler
+
+class Renderer:
+    # Draws the game onto the screen. In dirty-rect mode only the tiles, entity
+    # cells, HUD and message window that changed since the last frame are
+    # redrawn and pushed with pygame.display.update(rects). With an enabled
+    # Profiler, each drawing phase is timed and the percentiles are overlaid.
+    def __init__(self, screen, dirty_rects=True, profiler=None):
+        self.screen = screen
+        self.dirty_rects = dirty_rects
+        self.profiler = profiler or Profiler(enabled=False)
+        self.game_rect = pygame.Rect(0, 0, graphics.SCREEN_WIDTH, graphics.GAME_AREA_HEIGHT)
+        self.game_surface = pygame.Surface(self.game_rect.size)
+        self.camera = graphics.Camera()
+        self.map_layer = None
+        self.cells = {}
+        self.last_hud = None
+        self.last_messages = None
+        self.last_game_over = None
+
+    def invalidate(self):
+        # Force a full repaint on the next frame
+        self.last_game_over = None
+
+    def draw(self, player, dungeon, message_window, game_over, fov=None):
+        # With a field of view, unexplored tiles stay dark, explored ones out
+        # of sight are fogged and only entities in sight are drawn
+        if self.map_layer is None or self.map_layer.dungeon is not dungeon or self.map_layer.fov is not fov:
+            self.map_layer = graphics.MapLayer(dungeon, fov)
+            self.invalidate()
+
+        profiler = self.profiler
+        self.camera.follow(player, dungeon)
+        with profiler.phase("map"):
+            scrolled, changed_tiles = self.map_layer.refresh(self.camera)
+        with profiler.phase("entities"):
+            cells = self.entity_cells(player, dungeon, fov)
+        hud = (player.health, player.max_health, player.gold, player.level, player.exp, player.exp_to_level)
+        messages = (id(message_window), message_window.version)
+
+        if not self.dirty_rects or scrolled or game_over != self.last_game_over:
+            self.draw_full(cells, player, dungeon, message_window, game_over)
+        else:
+            rects = []
+            dirty_cells = set(changed_tiles)
+            for cell in cells.keys() | self.cells.keys():
+                if self.cell_signature(cells.get(cell)) != self.cell_signature(self.cells.get(cell)):
+                    dirty_cells.add(cell)
+            for x, y in dirty_cells:
+                rect = pygame.Rect(self.camera.to_screen(x, y), (graphics.TILE_SIZE, graphics.TILE_SIZE))
+                rects.append(rect)
+            if hud != self.last_hud:
+                rects.append(graphics.HUD_RECT)
+            if profiler.enabled:
+                rects.append(graphics.overlay_rect(len(profiler.overlay_rows())))
+            rects = [rect.clip(self.game_rect) for rect in rects]
+            rects = [rect for rect in rects if rect.width and rect.height]
+
+            for rect in rects:
+                self.draw_region(rect, cells, player, dungeon)
+                self.screen.blit(self.game_surface, rect, rect)
+                if game_over:
+                    with profiler.phase("ui"):
+                        self.screen.set_clip(rect)
+                        graphics.draw_game_over(self.screen)
+                        self.screen.set_clip(None)
+            if profiler.enabled:
+                graphics.draw_overlay(self.screen, profiler.overlay_rows())
+
+            if messages != self.last_messages:
+                with profiler.phase("messages"):
+                    message_window.draw(self.screen)
+                rects.append(message_window.get_rect())
+
+            if rects:
+                with profiler.phase("present"):
+                    pygame.display.update(rects)
+
+        self.cells = cells
+        self.last_hud = hud
+        self.last_messages = messages
+        self.last_game_over = game_over
+
+    def draw_full(self, cells, player, dungeon, message_window, game_over):
+        profiler = self.profiler
+        self.screen.fill(graphics.BACKGROUND_COLOR)
+        self.draw_region(self.game_rect, cells, player, dungeon)
+        self.screen.blit(self.game_surface, (0, 0))
+        with profiler.phase("messages"):
+            message_window.draw(self.screen)
+        if game_over:
+            with profiler.phase("ui"):
+                graphics.draw_game_over(self.screen)
+        if profiler.enabled:
+            graphics.draw_overlay(self.screen, profiler.overlay_rows())
+        with profiler.phase("present"):
+            pygame.display.flip()
+
+    def draw_region(self, rect, cells, player, dungeon):
+        profiler = self.profiler
+        surface = self.game_surface
+        surface.set_clip(rect)
+        with profiler.phase("map"):
+            surface.fill(graphics.BACKGROUND_COLOR, rect)
+            surface.blit(self.map_layer.surface, rect, rect)
+
+        # Only visit the cells the region overlaps
+        with profiler.phase("entities"):
+            camera = self.camera
+            x0 = camera.x + rect.left // graphics.TILE_SIZE
+            y0 = camera.y + rect.top // graphics.TILE_SIZE
+            x1 = camera.x + (rect.right - 1) // graphics.TILE_SIZE
+            y1 = camera.y + (rect.bottom - 1) // graphics.TILE_SIZE
+            for y in range(y0, y1 + 1):
+                for x in range(x0, x1 + 1):
+                    for kind, entity in cells.get((x, y), ()):
+                        if kind == "treasure":
+                            graphics.draw_treasure(surface, entity, camera)
+                        elif kind == "enemy":
+                            graphics.draw_enemy(surface, entity, camera)
+                        else:
+                            graphics.draw_player(surface, entity, camera)
+
+        if rect.colliderect(graphics.HUD_RECT):
+            with profiler.phase("ui"):
+                graphics.draw_ui(surface, player, dungeon)
+        surface.set_clip(None)
+
+    def entity_cells(self, player, dungeon, fov=None):
+        # Map each occupied cell inside the view to what is drawn there, bottom
+        # layer first. Only the view (or just the visible cells in it) is
+        # visited, so the cost doesn't grow with the size of the map.
+        cells = {}
+        camera = self.camera
+        if fov is not None:
+            visible = [(x, y) for x, y in fov.visible if camera.contains(x, y)]
+        else:
+            visible = ((x, y) for y in range(camera.y, camera.y + camera.height)
+                       for x in range(camera.x, camera.x + camera.width))
+        for x, y in visible:
+            treasure = dungeon.treasure_at(x, y)
+            enemy = dungeon.enemy_at(x, y)
+            if treasure or enemy:
+                layers = cells[(x, y)] = []
+                if treasure:
+                    layers.append(("treasure", treasure))
+                if enemy:
+                    layers.append(("enemy", enemy))
+        if camera.contains(player.x, player.y):
+            cells.setdefault((player.x, player.y), []).append(("player", player))
+        return cells
+
+    def cell_signature(self, layers):
+        if not layers:
+            return ()
+        return tuple((kind, getattr(entity, "color", None)) for kind, entity in layers)
@@ -0,0 +1,91 @@
+#!/usr/bin/env python3
+
+# Input recordings and a headless replay runner.
+#
+# A recording is a small header with everything needed to rebuild the game
+# (seed, map size, generator) followed by one byte per action, and a footer
+# with the turn count and GameState.digest() of the final state.
+#
+#   python main.py --seed 42 --record run.dgr
+#   python replay.py run.dgr
+
+import argparse
+import struct
+import sys
+import time
+from game import GameState, ACTIONS
+from world import GENERATORS
+
+MAGIC = b"DGRP"
+VERSION = 4
+HEADER = struct.Struct("<4sBQIIBB")  # magic, version, seed, width, height, generator, flags
+CHUNKED = 1
+MOVING_MONSTERS = 2
+END_OF_ACTIONS = 0xFF
+FOOTER = struct.Struct("<Q32s")  # turns, sha256 digest of the final state
+
+class Recorder:
+    def __init__(self, path, game):
+        self.game = game
+        self.file = open(path, "wb")
+        width, height = game.map_size
+        flags = (CHUNKED if game.chunked else 0) | (MOVING_MONSTERS if game.moving_monsters else 0)
+        self.file.write(HEADER.pack(MAGIC, VERSION, game.seed, width, height, GENERATORS.index(game.generator), flags))
+
+    def record(self, action):
+        self.file.write(bytes((ACTIONS.index(action),)))
+
+    def close(self):
+        self.file.write(bytes((END_OF_ACTIONS,)))
+        self.file.write(FOOTER.pack(self.game.turn, bytes.fromhex(self.game.digest())))
+        self.file.close()
+
+def load_recording(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, seed, width, height, generator, flags = HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} dungeon recording")
+    end = data.find(bytes((END_OF_ACTIONS,)), HEADER.size)
+    if end < 0:
+        # Recording was cut short (e.g. the game crashed); replay what is there
+        actions, footer = data[HEADER.size:], None
+    else:
+        actions, footer = data[HEADER.size:end], FOOTER.unpack_from(data, end + 1)
+    settings = {"seed": seed, "map_size": (width, height), "generator": GENERATORS[generator],
+                "chunked": bool(flags & CHUNKED), "moving_monsters": bool(flags & MOVING_MONSTERS)}
+    return settings, actions, footer
+
+def run_replay(settings, actions):
+    game = GameState(**settings)
+    step = game.step
+    for code in actions:
+        step(ACTIONS[code])
+    return game
+
+def main():
+    parser = argparse.ArgumentParser(description="Replay a dungeon recording headless and check its final state.")
+    parser.add_argument("recording")
+    args = parser.parse_args()
+
+    settings, actions, footer = load_recording(args.recording)
+    start = time.perf_counter()
+    game = run_replay(settings, actions)
+    elapsed = time.perf_counter() - start
+    digest = game.digest()
+    game.close()
+
+    print(f"{len(actions)} actions, {game.turn} turns in {elapsed:.3f}s ({len(actions) / max(elapsed, 1e-9):.0f} actions/s)")
+    print(f"final state {digest}")
+    if footer is None:
+        print("recording has no final state to check against")
+        return 0
+    turns, expected = footer
+    if turns == game.turn and expected.hex() == digest:
+        print("OK: final state matches the recording")
+        return 0
+    print(f"MISMATCH: recording ended at turn {turns} with state {expected.hex()}")
+    return 1
+
+if __name__ == "__main__":
+    sys.exit(main())
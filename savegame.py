@@ -0,0 +1,202 @@
+#!/usr/bin/env python3
+
+# Binary save files. A save is a short header followed by one zlib stream of
+# packed structs: the game settings, the player, both RNG states, the recent
+# messages, the levels as Dungeon.to_bytes records, the explored map and then
+# the turn queue.
+#
+# Saving is split in two so the game loop never waits on the disk:
+# take_snapshot() only copies the state into bytes on the main thread, and
+# Autosaver compresses and writes snapshots on a background thread.
+
+import os
+import queue
+import random
+import struct
+import sys
+import threading
+import zlib
+from game import GameState
+from message_window import MessageWindow
+from player import Player
+from world import Dungeon, GENERATORS
+from chunks import CHUNK_SIZE
+
+MAGIC = b"DGSV"
+VERSION = 3
+SAVE_HEADER = struct.Struct("<4sBI")  # magic, version, uncompressed payload length
+GAME_RECORD = struct.Struct("<QIIBBQB")  # seed, width, height, generator, moving monsters, turn, game over
+PLAYER_RECORD = struct.Struct("<10i")
+PLAYER_FIELDS = ("x", "y", "health", "max_health", "attack", "defense", "gold", "level", "exp", "exp_to_level")
+RNG_RECORD = struct.Struct("<I625IBd")  # random.Random.getstate(): version, Mersenne Twister words, gauss
+COUNT = struct.Struct("<I")
+LENGTH = struct.Struct("<I")
+EXPLORED_CHUNK = struct.Struct("<ii")  # chunk x, chunk y, then CHUNK_SIZE * CHUNK_SIZE flags
+CLOCK = struct.Struct("<Q")
+QUEUED_ENEMY = struct.Struct("<iiQ")  # x, y, time of its next action
+
+def pack_rng(rng):
+    version, words, gauss = rng.getstate()
+    return RNG_RECORD.pack(version, *words, gauss is not None, gauss or 0.0)
+
+def unpack_rng(data, offset):
+    values = RNG_RECORD.unpack_from(data, offset)
+    rng = random.Random()
+    rng.setstate((values[0], tuple(values[1:626]), values[627] if values[626] else None))
+    return rng
+
+def take_snapshot(game):
+    # Cheap enough to call every turn: struct packing plus a copy of the tiles
+    width, height = game.map_size
+    parts = [
+        GAME_RECORD.pack(game.seed, width, height, GENERATORS.index(game.generator), game.moving_monsters,
+                         game.turn, game.game_over),
+        PLAYER_RECORD.pack(*(getattr(game.player, field) for field in PLAYER_FIELDS)),
+        pack_rng(game.rng),
+        pack_rng(game.level_seeds),
+    ]
+    messages = list(game.message_window.messages)
+    parts.append(COUNT.pack(len(messages)))
+    for message in messages:
+        encoded = message.encode("utf-8")
+        parts.append(LENGTH.pack(len(encoded)))
+        parts.append(encoded)
+
+    # Room for several levels once the dungeon has more than one
+    levels = [game.dungeon.to_bytes(compress=False)]
+    parts.append(COUNT.pack(len(levels)))
+    for level in levels:
+        parts.append(LENGTH.pack(len(level)))
+        parts.append(level)
+
+    explored = game.field_of_view().explored
+    parts.append(COUNT.pack(len(explored)))
+    for (cx, cy), flags in explored.items():
+        parts.append(EXPLORED_CHUNK.pack(cx, cy))
+        parts.append(bytes(flags))
+
+    # Only monsters are queued between turns, in the order they will act
+    queued = game.scheduler.entries()
+    parts.append(CLOCK.pack(game.scheduler.now))
+    parts.append(COUNT.pack(len(queued)))
+    for time, enemy in queued:
+        parts.append(QUEUED_ENEMY.pack(enemy.x, enemy.y, time))
+    return b"".join(parts)
+
+def write_snapshot(path, snapshot):
+    # Write to a temporary file and rename, so a crash never leaves half a save
+    data = SAVE_HEADER.pack(MAGIC, VERSION, len(snapshot)) + zlib.compress(snapshot, 1)
+    temporary = path + ".tmp"
+    with open(temporary, "wb") as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+def load_game(path, pregenerate=0):
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, length = SAVE_HEADER.unpack_from(data)
+    if magic != MAGIC or version != VERSION:
+        raise ValueError(f"{path} is not a version {VERSION} dungeon save")
+    payload = zlib.decompress(memoryview(data)[SAVE_HEADER.size:])
+    if len(payload) != length:
+        raise ValueError(f"{path} is truncated")
+
+    offset = 0
+    seed, width, height, generator, moving_monsters, turn, game_over = GAME_RECORD.unpack_from(payload, offset)
+    offset += GAME_RECORD.size
+    game = GameState.__new__(GameState)
+    game.setup((width, height), False, GENERATORS[generator], seed, bool(moving_monsters))
+    game.turn = turn
+    game.game_over = bool(game_over)
+
+    player = Player(0, 0)
+    for field, value in zip(PLAYER_FIELDS, PLAYER_RECORD.unpack_from(payload, offset)):
+        setattr(player, field, value)
+    offset += PLAYER_RECORD.size
+
+    game.rng = unpack_rng(payload, offset)
+    offset += RNG_RECORD.size
+    game.level_seeds = unpack_rng(payload, offset)
+    offset += RNG_RECORD.size
+
+    message_window = MessageWindow()
+    (count,) = COUNT.unpack_from(payload, offset)
+    offset += COUNT.size
+    for _ in range(count):
+        (size,) = LENGTH.unpack_from(payload, offset)
+        offset += LENGTH.size
+        message_window.add_message(payload[offset:offset + size].decode("utf-8"))
+        offset += size
+
+    levels = []
+    (count,) = COUNT.unpack_from(payload, offset)
+    offset += COUNT.size
+    for _ in range(count):
+        (size,) = LENGTH.unpack_from(payload, offset)
+        offset += LENGTH.size
+        levels.append(Dungeon.from_bytes(payload[offset:offset + size]))
+        offset += size
+
+    game.enter_level(player, levels[0], message_window)
+
+    (count,) = COUNT.unpack_from(payload, offset)
+    offset += COUNT.size
+    for _ in range(count):
+        cx, cy = EXPLORED_CHUNK.unpack_from(payload, offset)
+        offset += EXPLORED_CHUNK.size
+        game.fov.explored[(cx, cy)] = bytearray(payload[offset:offset + CHUNK_SIZE * CHUNK_SIZE])
+        offset += CHUNK_SIZE * CHUNK_SIZE
+
+    (game.scheduler.now,) = CLOCK.unpack_from(payload, offset)
+    offset += CLOCK.size
+    (count,) = COUNT.unpack_from(payload, offset)
+    offset += COUNT.size
+    for _ in range(count):
+        x, y, time = QUEUED_ENEMY.unpack_from(payload, offset)
+        offset += QUEUED_ENEMY.size
+        game.scheduler.schedule(game.dungeon.enemy_at(x, y), time)
+
+    game.start_pipeline(pregenerate)
+    return game
+
+class Autosaver:
+    # Writes snapshots on a background thread. If the disk falls behind, only
+    # the newest snapshot is kept, so submit() never blocks the game loop. A
+    # failed write is reported and the next snapshot tried as usual.
+    def __init__(self, path):
+        self.path = path
+        self.error = None  # The last write error, reported once until it changes
+        self.snapshots = queue.Queue(maxsize=1)
+        self.thread = threading.Thread(target=self.run, name="autosave", daemon=True)
+        self.thread.start()
+
+    def submit(self, snapshot):
+        while True:
+            try:
+                self.snapshots.put_nowait(snapshot)
+                return
+            except queue.Full:
+                try:
+                    self.snapshots.get_nowait()  # Drop the older, unwritten snapshot
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        while True:
+            snapshot = self.snapshots.get()
+            if snapshot is None:
+                return
+            try:
+                write_snapshot(self.path, snapshot)
+                self.error = None
+            except OSError as error:
+                if str(error) != str(self.error):
+                    print(f"Autosave to {self.path} failed: {error}", file=sys.stderr, flush=True)
+                self.error = error
+
+    def close(self):
+        # Finish writing whatever is queued, then stop; a thread that died
+        # can't take the stop marker, so don't wait on it
+        if self.thread.is_alive():
+            self.snapshots.put(None)
+            self.thread.join()
@@ -0,0 +1,59 @@
+#!/usr/bin/env python3
+
+import heapq
+
+# An action takes ACTION_COST / speed time units: 120 at the normal speed of
+# 100, less for faster actors. Divisible by every speed in use, so all times
+# stay integers and games stay reproducible.
+ACTION_COST = 12000
+
+def action_time(actor):
+    return ACTION_COST // actor.speed
+
+class Scheduler:
+    # Actors queued by the time of their next action in a heap, so finding
+    # who acts next is O(log n) however many actors are waiting. Ties go to
+    # whoever was scheduled first. Rescheduled or removed actors leave stale
+    # heap entries behind, which are skipped when they come up.
+    def __init__(self):
+        self.reset()
+
+    def reset(self):
+        self.now = 0
+        self.queue = []  # (time, order, actor)
+        self.times = {}  # actor -> time of its next action
+        self.order = 0
+
+    def __len__(self):
+        return len(self.times)
+
+    def __contains__(self, actor):
+        return actor in self.times
+
+    def schedule(self, actor, time):
+        self.times[actor] = time
+        heapq.heappush(self.queue, (time, self.order, actor))
+        self.order += 1
+
+    def unschedule(self, actor):
+        self.times.pop(actor, None)
+
+    def next_time(self):
+        # Time of the next action, or None if nobody is waiting
+        queue = self.queue
+        while queue and self.times.get(queue[0][2]) != queue[0][0]:
+            heapq.heappop(queue)
+        return queue[0][0] if queue else None
+
+    def pop(self):
+        # The next actor to act; the clock moves on to its time
+        if self.next_time() is None:
+            return None
+        time, _, actor = heapq.heappop(self.queue)
+        del self.times[actor]
+        self.now = time
+        return actor
+
+    def entries(self):
+        # (time, actor) for everyone waiting, in the order they will act
+        return [(time, actor) for time, _, actor in sorted(self.queue) if self.times.get(actor) == time]
@@ -0,0 +1,189 @@
+#!/usr/bin/env python3
+
+# Monte-Carlo combat balance simulator. Runs whole batches of fights and
+# level clears as NumPy arrays, using the stats from monsters.Enemy,
+# player.Player and items.VALUE_RANGES so it follows any tuning done there.
+#
+#   python simulate.py --runs 100000 --seed 1
+#   python simulate.py --json balance.json
+
+import argparse
+import json
+import numpy
+from monsters import Enemy
+from player import Player
+from items import VALUE_RANGES
+from world import ENEMY_TYPES, TREASURE_TYPES
+
+ENEMIES_PER_LEVEL = 15
+TREASURES_PER_LEVEL = 10
+
+def enemy_stats():
+    # Column arrays indexed like ENEMY_TYPES
+    enemies = [Enemy(0, 0, enemy_type) for enemy_type in ENEMY_TYPES]
+    return {name: numpy.array([getattr(enemy, name) for enemy in enemies])
+            for name in ("health", "attack", "defense", "exp_reward")}
+
+def level_up_deltas():
+    # How much Player.level_up changes each stat
+    player = Player(0, 0)
+    before = dict(vars(player))
+    player.level_up()
+    return {name: getattr(player, name) - before[name]
+            for name in ("max_health", "attack", "defense", "exp_to_level")}
+
+def new_players(runs):
+    player = Player(0, 0)
+    return {name: numpy.full(runs, getattr(player, name), dtype=numpy.int64)
+            for name in ("health", "max_health", "attack", "defense", "gold", "level", "exp", "exp_to_level")}
+
+def resolve_fights(attack, defense, health, enemy_health, enemy_attack, enemy_defense):
+    # Bump-to-attack to the death, in closed form: the player hits first, the
+    # enemy hits back while it is alive. Same max(1, damage - defense) rule as
+    # Enemy.take_damage and Player.take_damage.
+    player_damage = numpy.maximum(1, attack - enemy_defense)
+    enemy_damage = numpy.maximum(1, enemy_attack - defense)
+    turns_to_kill = -(-enemy_health // player_damage)
+    turns_to_die = -(-health // enemy_damage)
+    won = turns_to_kill <= turns_to_die
+    turns = numpy.where(won, turns_to_kill, turns_to_die)
+    damage_taken = numpy.where(won, (turns_to_kill - 1) * enemy_damage, health)
+    return won, turns, damage_taken
+
+def gain_exp(players, amount, alive, deltas):
+    # Player.gain_exp / level_up for every run at once (at most one level per kill)
+    players["exp"] += numpy.where(alive, amount, 0)
+    up = alive & (players["exp"] >= players["exp_to_level"])
+    players["level"] += up
+    players["exp"][up] = 0
+    players["exp_to_level"] += up * deltas["exp_to_level"]
+    players["max_health"] += up * deltas["max_health"]
+    players["attack"] += up * deltas["attack"]
+    players["defense"] += up * deltas["defense"]
+    players["health"] = numpy.where(up, players["max_health"], players["health"])
+
+def duel_table(max_level, max_swords, runs, rng):
+    # One fresh fight per (player level, swords carried, enemy type), with the
+    # swords' attack bonus sampled runs times
+    stats = enemy_stats()
+    deltas = level_up_deltas()
+    base = Player(0, 0)
+    low, high = VALUE_RANGES["sword"]
+    rows = []
+    for level in range(1, max_level + 1):
+        levels = level - 1
+        max_health = base.max_health + levels * deltas["max_health"]
+        defense = base.defense + levels * deltas["defense"]
+        for swords in range(max_swords + 1):
+            bonus = rng.integers(low, high + 1, size=(runs, swords)).sum(axis=1)
+            attack = base.attack + levels * deltas["attack"] + bonus
+            health = numpy.full(runs, max_health)
+            for index, enemy_type in enumerate(ENEMY_TYPES):
+                won, turns, damage = resolve_fights(attack, defense, health, stats["health"][index],
+                                                    stats["attack"][index], stats["defense"][index])
+                rows.append({
+                    "level": level,
+                    "swords": swords,
+                    "enemy": enemy_type,
+                    "win_rate": float(won.mean()),
+                    "turns_to_kill": float(turns[won].mean()) if won.any() else None,
+                    "damage_taken": float(damage[won].mean()) if won.any() else None,
+                })
+    return rows
+
+def level_clears(runs, rng):
+    # A level's 15 enemies and 10 treasures, met in a random order per run
+    stats = enemy_stats()
+    deltas = level_up_deltas()
+    players = new_players(runs)
+    entity_count = ENEMIES_PER_LEVEL + TREASURES_PER_LEVEL
+
+    # Kinds 0..2 are ENEMY_TYPES, 3.. are TREASURE_TYPES
+    kinds = numpy.concatenate([
+        rng.integers(0, len(ENEMY_TYPES), size=(runs, ENEMIES_PER_LEVEL)),
+        rng.integers(0, len(TREASURE_TYPES), size=(runs, TREASURES_PER_LEVEL)) + len(ENEMY_TYPES),
+    ], axis=1)
+    kinds = rng.permuted(kinds, axis=1)
+    values = {treasure_type: rng.integers(low, high + 1, size=(runs, entity_count))
+              for treasure_type, (low, high) in VALUE_RANGES.items()}
+
+    alive = numpy.ones(runs, dtype=bool)
+    turns = numpy.zeros(runs, dtype=numpy.int64)
+    killed_by = numpy.full(runs, -1)
+    level_curve = []
+    for step in range(entity_count):
+        kind = kinds[:, step]
+        fighting = alive & (kind < len(ENEMY_TYPES))
+        enemy = numpy.minimum(kind, len(ENEMY_TYPES) - 1)
+        won, fight_turns, damage = resolve_fights(players["attack"], players["defense"], players["health"],
+                                                  stats["health"][enemy], stats["attack"][enemy], stats["defense"][enemy])
+        turns += numpy.where(fighting, fight_turns, 0)
+        players["health"] -= numpy.where(fighting, damage, 0)
+        died = fighting & ~won
+        killed_by[died] = enemy[died]
+        alive &= ~died
+        gain_exp(players, stats["exp_reward"][enemy], fighting & won, deltas)
+
+        for index, treasure_type in enumerate(TREASURE_TYPES):
+            found = alive & (kind == len(ENEMY_TYPES) + index)
+            value = values[treasure_type][:, step]
+            if treasure_type == "gold":
+                players["gold"] += numpy.where(found, value, 0)
+            elif treasure_type == "health":
+                players["health"] = numpy.where(found, numpy.minimum(players["max_health"], players["health"] + value),
+                                                players["health"])
+            elif treasure_type == "sword":
+                players["attack"] += numpy.where(found, value, 0)
+        level_curve.append(float(players["level"][alive].mean()) if alive.any() else None)
+
+    return {
+        "runs": runs,
+        "clear_rate": float(alive.mean()),
+        "deaths_by_enemy": {enemy_type: float((killed_by == index).mean()) for index, enemy_type in enumerate(ENEMY_TYPES)},
+        "mean_turns_in_combat": float(turns[alive].mean()) if alive.any() else None,
+        "final_level": {int(level): float((players["level"][alive] == level).mean())
+                        for level in numpy.unique(players["level"][alive])},
+        "final_attack_mean": float(players["attack"][alive].mean()) if alive.any() else None,
+        "level_curve": level_curve,
+    }
+
+def print_report(duels, clears):
+    print("Duels (fresh player at full health)")
+    print(f"{'level':>5} {'swords':>6} {'enemy':>7} {'win %':>7} {'turns':>6} {'damage':>7}")
+    for row in duels:
+        turns = "-" if row["turns_to_kill"] is None else f"{row['turns_to_kill']:.1f}"
+        damage = "-" if row["damage_taken"] is None else f"{row['damage_taken']:.1f}"
+        print(f"{row['level']:>5} {row['swords']:>6} {row['enemy']:>7} {row['win_rate'] * 100:>6.1f}% {turns:>6} {damage:>7}")
+
+    print()
+    print(f"Level clears ({clears['runs']} runs, entities met in random order)")
+    print(f"  clear rate:            {clears['clear_rate'] * 100:.1f}%")
+    for enemy_type, rate in clears["deaths_by_enemy"].items():
+        print(f"  killed by {enemy_type + ':':<12} {rate * 100:.1f}%")
+    if clears["mean_turns_in_combat"] is not None:
+        print(f"  turns in combat:       {clears['mean_turns_in_combat']:.1f}")
+        print(f"  final attack:          {clears['final_attack_mean']:.1f}")
+    for level, share in clears["final_level"].items():
+        print(f"  ended at level {level}:      {share * 100:.1f}%")
+    curve = " ".join("-" if level is None else f"{level:.2f}" for level in clears["level_curve"])
+    print(f"  mean level per step:   {curve}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Monte-Carlo combat balance simulator.")
+    parser.add_argument("--runs", type=int, default=100000, help="simulated fights or level clears per case")
+    parser.add_argument("--seed", type=int, default=None, help="seed for reproducible results")
+    parser.add_argument("--max-level", type=int, default=5, help="highest player level in the duel table")
+    parser.add_argument("--max-swords", type=int, default=3, help="most swords carried in the duel table")
+    parser.add_argument("--json", metavar="FILE", help="also write the results to FILE as JSON")
+    args = parser.parse_args()
+
+    rng = numpy.random.default_rng(args.seed)
+    duels = duel_table(args.max_level, args.max_swords, args.runs, rng)
+    clears = level_clears(args.runs, rng)
+    print_report(duels, clears)
+    if args.json:
+        with open(args.json, "w") as f:
+            json.dump({"duels": duels, "level_clears": clears}, f, indent=2)
+
+if __name__ == "__main__":
+    main()
@@ -1,52 +1,498 @@
 #!/usr/bin/env python3
 
 import random
-from monsters import Enemy
-from items import Treasure
+import struct
+import zlib
+from bisect import bisect_right
+from itertools import chain
+from monsters import Enemy, ENEMY_STATS
+from items import Treasure, VALUE_RANGES
+from chunks import ChunkedMap, CHUNK_SIZE
+
+try:
+    import numpy
+except ImportError:  # NumPy is optional; fall back to lists of lists
+    numpy = None
+
+# Maps with at least this many tiles use a NumPy array when NumPy is installed
+NUMPY_MIN_TILES = 10000
+
+ENEMY_TYPES = list(ENEMY_STATS)
+TREASURE_TYPES = list(VALUE_RANGES)
+
+# Chunked dungeons spawn entities at the same density as the classic 25x18 level
+ENEMIES_PER_TILE = 15 / (23 * 16)
+TREASURES_PER_TILE = 10 / (23 * 16)
+
+GENERATORS = ["random", "rooms", "caves"]
+MIN_LEAF_SIZE = 6  # Smallest BSP partition the rooms generator will split down to
+RANDOM_WALL_CHANCE = 0.15
+CAVE_WALL_CHANCE = 0.45
+CAVE_SMOOTHING_STEPS = 4
+
+# Packed entities (of an evicted chunk or a serialized level): x, y, type index, health or value
+ENTITY_RECORD = struct.Struct("<iiBi")
+COUNT = struct.Struct("<I")
+
+# Serialized level: width, height, generator index, uses NumPy, tiles compressed, tiles length
+LEVEL_HEADER = struct.Struct("<IIBBBI")
+
+def flood_fill(tiles, width, height, start, in_place=False):
+    # Scanline flood fill over the floor 8-connected to start (players move
+    # diagonally). Returns the reachable floor as (begin, end) runs of flat
+    # indices; the scans are bytearray.find calls, so big maps stay fast.
+    # With in_place the filled cells are marked as walls in tiles itself.
+    blocked = tiles if in_place else bytearray(tiles)  # Walls and cells already filled
+    if blocked[start]:
+        return []
+    spans = []
+    stack = [start]
+    while stack:
+        i = stack.pop()
+        if blocked[i]:
+            continue
+        y = i // width
+        row = y * width
+        left = blocked.rfind(b"\x01", row, i) + 1 or row
+        right = blocked.find(b"\x01", i, row + width)
+        if right < 0:
+            right = row + width
+        blocked[left:right] = b"\x01" * (right - left)
+        spans.append((left, right))
+
+        # Seed every open run touching this one (diagonals included) in the rows above and below
+        for ny in (y - 1, y + 1):
+            if 0 <= ny < height:
+                begin = ny * width + max(left - row - 1, 0)
+                end = ny * width + min(right - row + 1, width)
+                j = blocked.find(b"\x00", begin, end)
+                while j >= 0:
+                    stack.append(j)
+                    k = blocked.find(b"\x01", j, end)
+                    if k < 0:
+                        break
+                    j = blocked.find(b"\x00", k, end)
+    spans.sort()
+    return spans
+
+def sample_spans(spans, count, rng, exclude=None):
+    # Pick count distinct flat indices from the runs without expanding them
+    starts = []
+    total = 0
+    for begin, end in spans:
+        starts.append(total)
+        total += end - begin
+    skip = None
+    if exclude is not None:
+        for begin, end in spans:
+            if begin <= exclude < end:
+                skip = starts[spans.index((begin, end))] + exclude - begin
+                total -= 1
+                break
+    picks = []
+    for n in rng.sample(range(total), min(count, total)):
+        if skip is not None and n >= skip:
+            n += 1
+        k = bisect_right(starts, n) - 1
+        picks.append(spans[k][0] + n - starts[k])
+    return picks
 
 class Dungeon:
-    def __init__(self, width, height):
+    def __init__(self, width, height, use_numpy=None, chunked=False, generator="random", seed=None):
+        if generator not in GENERATORS:
+            raise ValueError(f"unknown generator {generator!r}, expected one of {GENERATORS}")
+        if chunked and generator != "random":
+            raise ValueError(f"chunked dungeons only support the random generator, not {generator!r}")
+        self.setup(width, height, use_numpy, chunked, generator)
+        # All of the level's randomness comes from here, so a seed reproduces it
+        self.rng = random.Random(seed)
+
+        if chunked:
+            # Nothing is generated up front; chunks appear as the player nears them
+            self.seed = self.rng.getrandbits(64)
+            self.map = ChunkedMap(width, height, self.generate_chunk,
+                                  self.load_chunk_entities, self.evict_chunk_entities)
+            self.load_around(1, 1)
+            return
+
+        self.generate_dungeon()
+        self.generate_entities()
+
+    def setup(self, width, height, use_numpy, chunked, generator):
         self.width = width
         self.height = height
-        self.map = [[0 for _ in range(width)] for _ in range(height)]
-        self.generate_dungeon()
+        self.chunked = chunked
+        self.generator = generator
         self.enemies = []
         self.treasures = []
-        self.generate_entities()
+        # Occupancy index: (x, y) -> entity, kept in sync by the methods below
+        self.enemy_cells = {}
+        self.treasure_cells = {}
+        self.changed_tiles = set()  # Tiles changed since the map layer was last refreshed
+        self.tile_version = 0  # Bumped on every tile change, for caches derived from the map
+
+        if chunked:
+            self.use_numpy = False
+            return
+        if use_numpy is None:
+            use_numpy = numpy is not None and width * height >= NUMPY_MIN_TILES
+        if use_numpy and numpy is None:
+            raise ImportError("use_numpy=True requires NumPy")
+        self.use_numpy = use_numpy
+        if use_numpy:
+            # uint8 array; dungeon.map[y][x] indexing works the same as with lists
+            self.map = numpy.zeros((height, width), dtype=numpy.uint8)
+        else:
+            self.map = [[0 for _ in range(width)] for _ in range(height)]
+
+    def to_bytes(self, compress=True):
+        # Compact form for handing a finished level between processes or to a
+        # save file: header, tiles, then the packed entity tables. Without
+        # compress it is little more than a copy of the tiles.
+        if self.chunked:
+            raise ValueError("chunked dungeons are generated lazily and can't be serialized whole")
+        tiles = bytes(self.get_tiles())
+        if compress:
+            tiles = zlib.compress(tiles)
+        header = LEVEL_HEADER.pack(self.width, self.height, GENERATORS.index(self.generator), self.use_numpy,
+                                   compress, len(tiles))
+        return header + tiles + self.pack_entities(self.enemies, self.treasures)
+
+    @classmethod
+    def from_bytes(cls, data):
+        width, height, generator, use_numpy, compressed, tiles_length = LEVEL_HEADER.unpack_from(data)
+        dungeon = cls.__new__(cls)
+        dungeon.setup(width, height, bool(use_numpy) and numpy is not None, False, GENERATORS[generator])
+        dungeon.rng = random.Random()
+        offset = LEVEL_HEADER.size
+        tiles = data[offset:offset + tiles_length]
+        dungeon.set_tiles(zlib.decompress(tiles) if compressed else tiles)
+        dungeon.unpack_entities(data[offset + tiles_length:])
+        return dungeon
 
     def generate_dungeon(self):
-        # Create a simple grid with walls around the edges
-        for y in range(self.height):
-            for x in range(self.width):
-                if x == 0 or y == 0 or x == self.width - 1 or y == self.height - 1:
-                    self.map[y][x] = 1  # Wall
-                else:
-                    # Randomly generate some inner walls
-                    if random.random() < 0.15:
-                        self.map[y][x] = 1  # Wall
+        if self.generator == "rooms":
+            self.set_tiles(self.generate_rooms())
+            return
+        if self.generator == "caves":
+            self.set_tiles(self.generate_caves())
+            return
+        tiles = self.wall_noise(RANDOM_WALL_CHANCE)
+        width, height = self.width, self.height
+        # Walls around the edges
+        tiles[:width] = b"\x01" * width
+        tiles[(height - 1) * width:] = b"\x01" * width
+        for y in range(height):
+            tiles[y * width] = 1
+            tiles[y * width + width - 1] = 1
 
         # Ensure player start position is clear
-        self.map[1][1] = 0
-        self.map[1][2] = 0
-        self.map[2][1] = 0
+        tiles[1 * width + 1] = 0
+        tiles[1 * width + 2] = 0
+        tiles[2 * width + 1] = 0
+        self.set_tiles(tiles)
+
+    def wall_noise(self, chance):
+        # A wall (1) in each cell with the given chance, as a flat bytearray.
+        # Drawn as bytes from the level's rng and mapped through a lookup
+        # table, which is fast without NumPy and gives the same level for a
+        # seed whether or not NumPy is installed.
+        threshold = round(chance * 256)
+        table = bytes(1 if value < threshold else 0 for value in range(256))
+        return bytearray(self.rng.randbytes(self.width * self.height).translate(table))
+
+    def generate_rooms(self):
+        # Binary space partitioning: split the map into leaves, dig a room in
+        # each leaf and join sibling subtrees with corridors, so every room is
+        # connected by construction.
+        width, height = self.width, self.height
+        tiles = bytearray(b"\x01") * (width * height)
+
+        def dig(x, y):
+            tiles[y * width + x] = 0
+
+        def corridor(a, b):
+            (x0, y0), (x1, y1) = a, b
+            for x in range(min(x0, x1), max(x0, x1) + 1):
+                dig(x, y0)
+            for y in range(min(y0, y1), max(y0, y1) + 1):
+                dig(x1, y)
+
+        def build(x, y, w, h):
+            split_x = w >= 2 * MIN_LEAF_SIZE and (w >= h or h < 2 * MIN_LEAF_SIZE)
+            split_y = not split_x and h >= 2 * MIN_LEAF_SIZE
+            if split_x:
+                cut = self.rng.randint(MIN_LEAF_SIZE, w - MIN_LEAF_SIZE)
+                a = build(x, y, cut, h)
+                b = build(x + cut, y, w - cut, h)
+            elif split_y:
+                cut = self.rng.randint(MIN_LEAF_SIZE, h - MIN_LEAF_SIZE)
+                a = build(x, y, w, cut)
+                b = build(x, y + cut, w, h - cut)
+            else:
+                # Leaf: a room with a wall margin on its right and bottom
+                room_w = self.rng.randint(min(3, w), max(min(3, w), w - 1))
+                room_h = self.rng.randint(min(3, h), max(min(3, h), h - 1))
+                room_x = x + self.rng.randint(0, w - room_w)
+                room_y = y + self.rng.randint(0, h - room_h)
+                for ry in range(room_y, room_y + room_h):
+                    for rx in range(room_x, room_x + room_w):
+                        dig(rx, ry)
+                return (room_x + room_w // 2, room_y + room_h // 2)
+            corridor(a, b)
+            return self.rng.choice((a, b))
+
+        center = build(1, 1, width - 2, height - 2)
+
+        # Ensure player start position is clear and joined to the rooms
+        dig(1, 1)
+        dig(2, 1)
+        dig(1, 2)
+        corridor((1, 1), center)
+        return tiles
+
+    def generate_caves(self):
+        # Cellular automaton: random noise smoothed into caves (a cell becomes
+        # wall with 5+ wall neighbours, stays wall with 4+), then every
+        # pocket the player can't reach from the start is filled in
+        width, height = self.width, self.height
+        tiles = self.wall_noise(CAVE_WALL_CHANCE)
+        if numpy is not None:
+            walls = numpy.frombuffer(bytes(tiles), dtype=numpy.uint8).reshape(height, width)
+            for _ in range(CAVE_SMOOTHING_STEPS):
+                padded = numpy.pad(walls, 1, constant_values=1)
+                neighbors = sum(padded[1 + dy:height + 1 + dy, 1 + dx:width + 1 + dx]
+                                for dy in (-1, 0, 1) for dx in (-1, 0, 1) if dx or dy)
+                walls = ((neighbors >= 5) | ((walls == 1) & (neighbors >= 4))).astype(numpy.uint8)
+            tiles = bytearray(walls.tobytes())
+        else:
+            for _ in range(CAVE_SMOOTHING_STEPS):
+                smoothed = bytearray(width * height)
+                for y in range(height):
+                    for x in range(width):
+                        neighbors = 0
+                        for ny in (y - 1, y, y + 1):
+                            for nx in (x - 1, x, x + 1):
+                                if (nx, ny) != (x, y):
+                                    if not (0 <= nx < width and 0 <= ny < height) or tiles[ny * width + nx]:
+                                        neighbors += 1
+                        wall = tiles[y * width + x]
+                        smoothed[y * width + x] = 1 if neighbors >= 5 or (wall and neighbors >= 4) else 0
+                tiles = smoothed
+
+        for x in range(width):
+            tiles[x] = 1
+            tiles[(height - 1) * width + x] = 1
+        for y in range(height):
+            tiles[y * width] = 1
+            tiles[y * width + width - 1] = 1
+
+        # Keep only the largest cave; every other pocket becomes wall
+        visited = bytearray(tiles)
+        largest, largest_size = [], 0
+        i = visited.find(b"\x00")
+        while i >= 0:
+            spans = flood_fill(visited, width, height, i, in_place=True)
+            size = sum(end - begin for begin, end in spans)
+            if size > largest_size:
+                largest, largest_size = spans, size
+            i = visited.find(b"\x00", i)
+        cave = bytearray(b"\x01") * (width * height)
+        for begin, end in largest:
+            cave[begin:end] = bytes(end - begin)
+
+        # Ensure player start position is clear and dig through to the cave
+        cave[1 * width + 1] = 0
+        cave[1 * width + 2] = 0
+        cave[2 * width + 1] = 0
+        if largest:
+            target_x, target_y = largest[0][0] % width, largest[0][0] // width
+            for x in range(1, target_x + 1):
+                cave[1 * width + x] = 0
+            for y in range(1, target_y + 1):
+                cave[y * width + target_x] = 0
+        return cave
+
+    def get_tiles(self):
+        # The map as a flat bytearray, row by row
+        if self.use_numpy:
+            return bytearray(self.map.tobytes())
+        return bytearray(chain.from_iterable(self.map))
+
+    def set_tiles(self, tiles):
+        width = self.width
+        if self.use_numpy:
+            self.map[:] = numpy.frombuffer(bytes(tiles), dtype=numpy.uint8).reshape(self.height, width)
+        else:
+            self.map = [list(tiles[y * width:(y + 1) * width]) for y in range(self.height)]
+        self.tile_version += 1
+
+    def reachable_cells(self):
+        # Runs of flat indices of the floor reachable from the player start
+        return flood_fill(self.get_tiles(), self.width, self.height, 1 * self.width + 1)
+
+    def set_tile(self, x, y, tile_type):
+        if self.map[y][x] != tile_type:
+            self.map[y][x] = tile_type
+            self.changed_tiles.add((x, y))
+            self.tile_version += 1
+
+    def add_enemy(self, enemy):
+        self.enemies.append(enemy)
+        self.enemy_cells[(enemy.x, enemy.y)] = enemy
+
+    def remove_enemy(self, enemy):
+        self.enemies.remove(enemy)
+        del self.enemy_cells[(enemy.x, enemy.y)]
+
+    def move_enemy(self, enemy, x, y):
+        del self.enemy_cells[(enemy.x, enemy.y)]
+        enemy.x = x
+        enemy.y = y
+        self.enemy_cells[(x, y)] = enemy
+
+    def enemy_at(self, x, y):
+        return self.enemy_cells.get((x, y))
+
+    def enemies_within(self, x, y, radius):
+        # Enemies in the square of the given radius around (x, y), found by
+        # whichever is cheaper: scanning the enemies or the cells
+        if len(self.enemies) <= (2 * radius + 1) ** 2:
+            return [enemy for enemy in self.enemies if abs(enemy.x - x) <= radius and abs(enemy.y - y) <= radius]
+        found = []
+        for cy in range(y - radius, y + radius + 1):
+            for cx in range(x - radius, x + radius + 1):
+                enemy = self.enemy_cells.get((cx, cy))
+                if enemy:
+                    found.append(enemy)
+        return found
+
+    def add_treasure(self, treasure):
+        self.treasures.append(treasure)
+        self.treasure_cells[(treasure.x, treasure.y)] = treasure
+
+    def remove_treasure(self, treasure):
+        self.treasures.remove(treasure)
+        del self.treasure_cells[(treasure.x, treasure.y)]
+
+    def treasure_at(self, x, y):
+        return self.treasure_cells.get((x, y))
 
     def generate_entities(self):
+        # Sample spots straight from the floor reachable from the start, so
+        # nothing is sealed behind walls and placement time is bounded
+        start = 1 * self.width + 1
+        floor = self.reachable_cells()
+
         # Generate enemies
-        for _ in range(15):
-            while True:
-                x = random.randint(1, self.width - 2)
-                y = random.randint(1, self.height - 2)
-                if self.map[y][x] == 0:
-                    enemy_type = random.choice(["goblin", "orc", "dragon"])
-                    self.enemies.append(Enemy(x, y, enemy_type))
-                    break
+        for i in sample_spans(floor, 15, self.rng, exclude=start):
+            enemy_type = self.rng.choice(ENEMY_TYPES)
+            self.add_enemy(Enemy(i % self.width, i // self.width, enemy_type))
 
         # Generate treasures
-        for _ in range(10):
-            while True:
-                x = random.randint(1, self.width - 2)
-                y = random.randint(1, self.height - 2)
-                if self.map[y][x] == 0:
-                    treasure_type = random.choice(["gold", "health", "sword"])
-                    self.treasures.append(Treasure(x, y, treasure_type))
-                    break
\ No newline at end of file
+        for i in sample_spans(floor, 10, self.rng, exclude=start):
+            treasure_type = self.rng.choice(TREASURE_TYPES)
+            self.add_treasure(Treasure(i % self.width, i // self.width, treasure_type, self.rng))
+
+    def load_around(self, x, y):
+        # Make sure the chunks around (x, y) are in memory, with their entities
+        if self.chunked:
+            self.map.load_around(x, y, CHUNK_SIZE)
+
+    def close(self):
+        if self.chunked:
+            self.map.close()
+
+    def chunk_rng(self, cx, cy, purpose):
+        # Each chunk has its own generator so it comes out the same whenever,
+        # and in whatever order, it is first visited
+        return random.Random(f"{self.seed}:{cx}:{cy}:{purpose}")
+
+    def generate_chunk(self, cx, cy):
+        rng = self.chunk_rng(cx, cy, "tiles")
+        tiles = bytearray(CHUNK_SIZE * CHUNK_SIZE)
+        for ly in range(CHUNK_SIZE):
+            y = cy * CHUNK_SIZE + ly
+            for lx in range(CHUNK_SIZE):
+                x = cx * CHUNK_SIZE + lx
+                if x == 0 or y == 0 or x >= self.width - 1 or y >= self.height - 1:
+                    tiles[ly * CHUNK_SIZE + lx] = 1  # Wall (and anything past the edge)
+                elif rng.random() < RANDOM_WALL_CHANCE:
+                    tiles[ly * CHUNK_SIZE + lx] = 1  # Wall
+
+        # Ensure player start position is clear
+        if cx == 0 and cy == 0:
+            tiles[1 * CHUNK_SIZE + 1] = 0
+            tiles[1 * CHUNK_SIZE + 2] = 0
+            tiles[2 * CHUNK_SIZE + 1] = 0
+        return tiles
+
+    def load_chunk_entities(self, cx, cy, extra, fresh):
+        if fresh:
+            self.generate_chunk_entities(cx, cy)
+        else:
+            self.unpack_entities(extra)
+
+    def pack_entities(self, enemies, treasures):
+        records = []
+        for entities, types, attribute in ((enemies, ENEMY_TYPES, "health"),
+                                           (treasures, TREASURE_TYPES, "value")):
+            records.append(COUNT.pack(len(entities)))
+            for entity in entities:
+                records.append(ENTITY_RECORD.pack(entity.x, entity.y, types.index(entity.type), getattr(entity, attribute)))
+        return b"".join(records)
+
+    def unpack_entities(self, data):
+        offset = 0
+        for kind in ("enemy", "treasure"):
+            (count,) = COUNT.unpack_from(data, offset)
+            offset += COUNT.size
+            for _ in range(count):
+                x, y, type_index, amount = ENTITY_RECORD.unpack_from(data, offset)
+                offset += ENTITY_RECORD.size
+                if kind == "enemy":
+                    enemy = Enemy(x, y, ENEMY_TYPES[type_index])
+                    enemy.health = amount
+                    self.add_enemy(enemy)
+                else:
+                    treasure = Treasure(x, y, TREASURE_TYPES[type_index], self.rng)
+                    treasure.value = amount
+                    self.add_treasure(treasure)
+
+    def generate_chunk_entities(self, cx, cy):
+        rng = self.chunk_rng(cx, cy, "entities")
+        tiles = self.map.chunks[(cx, cy)]
+        start = (1, 1)  # Kept clear for the player, as in generate_entities
+        floor = CHUNK_SIZE * CHUNK_SIZE
+        for count, cells, spawn in ((round(ENEMIES_PER_TILE * floor), self.enemy_cells, self.spawn_enemy),
+                                    (round(TREASURES_PER_TILE * floor), self.treasure_cells, self.spawn_treasure)):
+            for _ in range(count):
+                # A bounded number of tries, since a chunk may be mostly wall
+                for _ in range(20):
+                    lx = rng.randrange(CHUNK_SIZE)
+                    ly = rng.randrange(CHUNK_SIZE)
+                    x = cx * CHUNK_SIZE + lx
+                    y = cy * CHUNK_SIZE + ly
+                    if tiles[ly * CHUNK_SIZE + lx] == 0 and (x, y) not in cells and (x, y) != start:
+                        spawn(x, y, rng)
+                        break
+
+    def spawn_enemy(self, x, y, rng):
+        self.add_enemy(Enemy(x, y, rng.choice(ENEMY_TYPES)))
+
+    def spawn_treasure(self, x, y, rng):
+        self.add_treasure(Treasure(x, y, rng.choice(TREASURE_TYPES), rng))
+
+    def evict_chunk_entities(self, cx, cy):
+        def in_chunk(entity):
+            return entity.x // CHUNK_SIZE == cx and entity.y // CHUNK_SIZE == cy
+
+        enemies = [enemy for enemy in self.enemies if in_chunk(enemy)]
+        treasures = [treasure for treasure in self.treasures if in_chunk(treasure)]
+        for enemy in enemies:
+            del self.enemy_cells[(enemy.x, enemy.y)]
+        for treasure in treasures:
+            del self.treasure_cells[(treasure.x, treasure.y)]
+        self.enemies[:] = [enemy for enemy in self.enemies if not in_chunk(enemy)]
+        self.treasures[:] = [treasure for treasure in self.treasures if not in_chunk(treasure)]
+        return self.pack_entities(enemies, treasures)
\ No newline at end of file